@@ -0,0 +1,364 @@
+import gzip
+import json
+from datetime import datetime
+from flask import Blueprint, Response, request, current_app, url_for
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import Venue, Artist, Show
+from forms import VenueForm, ArtistForm, ShowForm, form_data
+from pagination import keyset_page, page_cursors, PER_PAGE
+from search import search
+from routing import read_replica
+from importer import FORMATS, import_stream
+from genres import requested_genres, genre_filter, genre_names
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+# /api/v1/<venues|artists|shows>[/<id>] with ?fields= to pick the fields of
+# each item and keyset pagination through ?after= / ?before= cursors, like
+# the HTML listings. Only the selected columns are queried (genres with one
+# more query per page). Venues and artists filter by ?genre= and ?state=.
+# Creating goes through the same forms as the HTML pages, fed from the JSON
+# body.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MAX_PER_PAGE = 100
+# responses smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 512
+
+VENUE_FIELDS = {
+    'id': Venue.id,
+    'name': Venue.name,
+    'city': Venue.city,
+    'state': Venue.state,
+    'address': Venue.address,
+    'phone': Venue.phone,
+    'genres': None,
+    'image_link': Venue.image_link,
+    'facebook_link': Venue.facebook_link,
+    'website_link': Venue.website_link,
+    'seeking_talent': Venue.seeking_talent,
+    'seeking_description': Venue.seeking_description,
+    'upcoming_shows_count': Venue.upcoming_shows_count,
+    'past_shows_count': Venue.past_shows_count,
+    'next_show_at': Venue.next_show_at,
+}
+ARTIST_FIELDS = {
+    'id': Artist.id,
+    'name': Artist.name,
+    'city': Artist.city,
+    'state': Artist.state,
+    'phone': Artist.phone,
+    'genres': None,
+    'image_link': Artist.image_link,
+    'facebook_link': Artist.facebook_link,
+    'website_link': Artist.website_link,
+    'seeking_venue': Artist.seeking_venue,
+    'seeking_description': Artist.seeking_description,
+    'upcoming_shows_count': Artist.upcoming_shows_count,
+    'past_shows_count': Artist.past_shows_count,
+    'next_show_at': Artist.next_show_at,
+}
+SHOW_FIELDS = {
+    'id': Show.id,
+    'start_time': Show.start_time,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name.label('venue_name'),
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name.label('artist_name'),
+    'artist_image_link': Artist.image_link.label('artist_image_link'),
+}
+
+# Fields map to the column selected for them; None marks genres, which
+# are loaded per page by genre_names().
+
+# resource -> (model, kind, fields, default list fields, page key, form)
+RESOURCES = {
+    'venues': (Venue, 'venue', VENUE_FIELDS, ('id', 'name', 'city', 'state'),
+               (Venue.id,), VenueForm),
+    'artists': (Artist, 'artist', ARTIST_FIELDS, ('id', 'name'),
+                (Artist.id,), ArtistForm),
+    'shows': (Show, 'show', SHOW_FIELDS, tuple(SHOW_FIELDS),
+              (Show.start_time, Show.id), ShowForm),
+}
+
+
+class APIError(Exception):
+
+    def __init__(self, status, message, **extra):
+        Exception.__init__(self, message)
+        self.status = status
+        self.body = dict(extra, error=message)
+
+
+@api.errorhandler(APIError)
+def api_error(error):
+    return json_response(error.body, error.status)
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+@api.errorhandler(405)
+def http_error(error):
+    return json_response({'error': error.description}, error.code)
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=lambda value: (
+        value.isoformat() if isinstance(value, datetime) else str(value)))
+
+
+def json_response(data, status=200, headers=None):
+    return Response(dumps(data), status, headers,
+                    mimetype='application/json')
+
+
+@api.after_request
+def compress(response):
+    if (response.direct_passthrough or
+            'Content-Encoding' in response.headers or
+            response.content_length is None or
+            response.content_length < COMPRESS_MIN_SIZE):
+        return response
+    response.vary.add('Accept-Encoding')
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(response.get_data(), quality=4))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(response.get_data(), 6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def selected(fields, default):
+    # the ?fields= names, checked against the resource's fields
+    names = request.args.get('fields')
+    if not names:
+        return list(default)
+    names = [name.strip() for name in names.split(',') if name.strip()]
+    unknown = sorted(set(names) - set(fields))
+    if unknown:
+        raise APIError(400, 'unknown fields', fields=unknown)
+    return names
+
+
+def project(fields, names, extra=()):
+    # the columns to select: the requested ones plus any key columns, and
+    # the id when the genres are wanted
+    columns = [fields[name] for name in names if fields[name] is not None]
+    if 'genres' in names:
+        extra = tuple(extra) + (fields['id'],)
+    for column in extra:
+        if column.key not in names and column.key not in [
+                selected.key for selected in columns]:
+            columns.append(column)
+    return columns
+
+
+def serialize(model, rows, names):
+    genres = (genre_names(model, [row.id for row in rows])
+              if 'genres' in names else {})
+    items = []
+    for row in rows:
+        item = dict((name, getattr(row, name)) for name in names
+                    if name != 'genres')
+        if 'genres' in names:
+            item['genres'] = genres.get(row.id, [])
+        items.append(item)
+    return items
+
+
+def show_query(columns):
+    return db.session.query(*columns).join(
+        Venue, Venue.id == Show.venue_id
+    ).join(
+        Artist, Artist.id == Show.artist_id)
+
+
+def per_page():
+    try:
+        limit = int(request.args.get('limit', PER_PAGE))
+    except ValueError:
+        raise APIError(400, 'limit must be a number')
+    return max(1, min(limit, MAX_PER_PAGE))
+
+
+def page_response(model, page, names):
+    return json_response({
+        'data': serialize(model, page.items, names),
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+#  Lists
+#  ----------------------------------------------------------------
+
+
+@api.route('/<any(venues, artists, shows):resource>')
+@read_replica
+def list_resource(resource):
+    model, kind, fields, default, key, form = RESOURCES[resource]
+    names = selected(fields, default)
+    columns = project(fields, names, key)
+    after, before = page_cursors()
+
+    descending = False
+    if resource == 'shows':
+        query = show_query(columns)
+        for name in ('venue_id', 'artist_id'):
+            if name in request.args:
+                value = request.args.get(name, type=int)
+                if value is None:
+                    raise APIError(400, '%s must be a number' % name)
+                query = query.filter(fields[name] == value)
+        # upcoming shows soonest first (the default) or past shows newest first
+        when = request.args.get('when', 'upcoming')
+        if when == 'upcoming':
+            query = query.filter(Show.start_time > datetime.now())
+        elif when == 'past':
+            query = query.filter(Show.start_time < datetime.now())
+            descending = True
+        elif when != 'all':
+            raise APIError(400, 'when must be upcoming, past or all')
+    else:
+        query = db.session.query(*columns)
+        genres = requested_genres()
+        if genres:
+            query = query.filter(genre_filter(model, genres))
+        if request.args.get('state'):
+            query = query.filter(model.state == request.args['state'])
+
+    try:
+        page = keyset_page(query, key, after, before, descending, per_page())
+    except ValueError:
+        raise APIError(400, 'invalid cursor')
+    return page_response(model, page, names)
+
+
+#  Details
+#  ----------------------------------------------------------------
+
+
+def detail(resource, item_id, names=None):
+    model, kind, fields, default, key, form = RESOURCES[resource]
+    if names is None:
+        names = selected(fields, fields)
+    columns = project(fields, names)
+    if resource == 'shows':
+        query = show_query(columns)
+    else:
+        query = db.session.query(*columns)
+    row = query.filter(model.id == item_id).first()
+    if row is None:
+        raise APIError(404, '%s %d not found' % (kind, item_id))
+
+    return serialize(model, [row], names)[0]
+
+
+@api.route('/<any(venues, artists, shows):resource>/<int:item_id>')
+@read_replica
+def show_resource(resource, item_id):
+    return json_response({'data': detail(resource, item_id)})
+
+
+#  Search
+#  ----------------------------------------------------------------
+
+
+@api.route('/<any(venues, artists):resource>/search')
+@read_replica
+def search_resource(resource):
+    model, kind, fields, default, key, form = RESOURCES[resource]
+    after, before = page_cursors()
+    try:
+        total, page = search(model, request.args.get('q', ''), after, before,
+                             per_page(), requested_genres())
+    except ValueError:
+        raise APIError(400, 'invalid cursor')
+
+    return json_response({
+        'count': total,
+        'data': [{
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows,
+        } for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+#  Create
+#  ----------------------------------------------------------------
+
+
+@api.route('/<any(venues, artists, shows):resource>', methods=['POST'])
+def create_resource(resource):
+    model, kind, fields, default, key, form_class = RESOURCES[resource]
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise APIError(400, 'expected a JSON object')
+
+    form = form_class(form_data(body), meta={'csrf': False})
+    valid = form.validate()
+    if resource == 'shows':
+        # ShowForm takes the ids as free text
+        for name, other in (('venue_id', Venue), ('artist_id', Artist)):
+            value = form[name].data or ''
+            if not value.isdigit() or db.session.query(other.id).filter(
+                    other.id == int(value)).first() is None:
+                form[name].errors.append('No such %s.' % name[:-3])
+                valid = False
+    if not valid:
+        raise APIError(422, 'invalid %s' % kind, fields=form.errors)
+
+    item = model()
+    form.populate_obj(item)
+    try:
+        db.session.add(item)
+        db.session.commit()
+        item_id = item.id
+    except IntegrityError:
+        db.session.rollback()
+        current_app.logger.info('%s could not be created', kind,
+                                exc_info=True)
+        raise APIError(409, '%s conflicts with existing data' % kind)
+    except BaseException:
+        db.session.rollback()
+        current_app.logger.exception('%s could not be created', kind)
+        raise
+    finally:
+        db.session.close()
+
+    return json_response({'data': detail(resource, item_id, list(fields))},
+                         201, {'Location': url_for(
+                             'api.show_resource', resource=resource,
+                             item_id=item_id)})
+
+
+#  Bulk import
+#  ----------------------------------------------------------------
+
+
+@api.route('/<any(venues, artists, shows):resource>/import',
+           methods=['POST'])
+def import_resource(resource):
+    format = FORMATS.get(request.mimetype)
+    if format is None:
+        raise APIError(415, 'send text/csv or application/x-ndjson')
+    return json_response(
+        import_stream(resource, request.stream, format).as_dict())
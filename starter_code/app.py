@@ -4,25 +4,29 @@
 import json
 import dateutil.parser
 import babel
+import babel.dates
 from flask import (
     Flask,
     render_template,
     request, Response,
     flash,
     redirect,
-    url_for
+    url_for,
+    abort,
+    jsonify,
+    stream_with_context
 )
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging import (
-    Formatter, FileHandler, error
-)
+from routing import RoutingSQLAlchemy, init_routing, read_replica
 from flask_wtf import Form
 from flask_migrate import Migrate
+from engine import engine_options, init_engine, pool_status
+from signing import RotatingSessionInterface
+from applog import init_logging
+from metrics import init_metrics, render_metrics
 from forms import *
 from datetime import datetime
-import sys
+from functools import lru_cache
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -30,79 +34,68 @@ import sys
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+app.session_interface = RotatingSessionInterface()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+db = RoutingSQLAlchemy(app)
+init_engine(app)
+init_routing(app)
+init_metrics(app)
 migrate = Migrate(app, db)
 
 from models import *
+from queries import *
+from search import search
+from pagination import paginate, page_cursors
+from cache import cached_page, cache_depends, cache_until, entity_tag
+from conditional import (
+    conditional_page, venue_version, artist_version, venues_version,
+    artists_version
+)
+from api import api
+from importer import import_command
+from exporter import MIMETYPES, export, export_command, export_formats
+from counters import counters_cli
+from genres import requested_genres, genre_filter
+from feed import feed_cli
+from jobs import jobs_cli
+
+app.register_blueprint(api)
+app.cli.add_command(import_command)
+app.cli.add_command(export_command)
+app.cli.add_command(counters_cli)
+app.cli.add_command(feed_cli)
+app.cli.add_command(jobs_cli)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
-
-
-app.jinja_env.filters['datetime'] = format_datetime
-
-#----------------------------------------------------------------------------#
-# up coming shows & past shows
-#----------------------------------------------------------------------------#
-
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
 
-def upcoming_shows(shows, type):
 
-    upcoming_shows = []
-    currunt_time = datetime.now()
+@lru_cache(maxsize=64)
+def datetime_pattern(format, locale):
+    # compiled Babel pattern and parsed locale, per (format, locale)
+    return babel.dates.parse_pattern(format), babel.Locale.parse(locale)
 
-    for show in shows:
-        if show.start_time > currunt_time:
-            if type == 'artist':
-                upcoming_shows.append({
-                    "artist_id": show.artist_id,
-                    "artist_name": show.artist.name,
-                    "artist_image_link": show.artist.image_link,
-                    "start_time": format_datetime(str(show.start_time))
-                })
-            else:
-                upcoming_shows.append({
-                    "venue_id": show.venue_id,
-                    "venue_name": show.venue.name,
-                    "venue_image_link": show.venue.image_link,
-                    "start_time": format_datetime(str(show.start_time))})
 
-    return upcoming_shows
+@lru_cache(maxsize=4096)
+def render_datetime(date, format, locale):
+    pattern, locale = datetime_pattern(format, locale)
+    return pattern.apply(date, locale)
 
 
-def past_shows(shows, type):
+def format_datetime(value, format='medium', locale='en'):
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    return render_datetime(value, DATETIME_FORMATS.get(format, format), locale)
 
-    past_shows = []
-    currunt_time = datetime.now()
 
-    for show in shows:
-        if show.start_time < currunt_time:
-
-            if type == 'artist':
-                past_shows.append({
-                    "artist_id": show.artist_id,
-                    "artist_name": show.artist.name,
-                    "artist_image_link": show.artist.image_link,
-                    "start_time": format_datetime(str(show.start_time))
-                })
-            else:
-                past_shows.append({
-                    "venue_id": show.venue_id,
-                    "venue_name": show.venue.name,
-                    "venue_image_link": show.venue.image_link,
-                    "start_time": format_datetime(str(show.start_time))})
-
-    return past_shows
+app.jinja_env.filters['datetime'] = format_datetime
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -119,85 +112,84 @@ def index():
 
 
 @app.route('/venues')
+@read_replica
+@conditional_page(venues_version)
+@cached_page
 def venues():
 
-    data = []
-
-    result = db.session.query(Venue.city, Venue.state).distinct(
-        Venue.city, Venue.state)
-
-    for city in result:
-        venue_data = []
-        venues = Venue.query.filter(Venue.state == city.state).filter(
-            Venue.city == city.city).all()
-
-        for venue in venues:
-
-            shows = db.session.query(Show).join(Artist).filter(Show.venue_id==venue.id).all()
-
-            venue_data.append({
-                'id': venue.id,
-                'name': venue.name,
-                'num_upcoming_shows': len(upcoming_shows(shows, 'artist'))
-            })
-        data.append({
-            'city': city.city,
-            'state': city.state,
-            'venues': venue_data
-        })
+    after, before = page_cursors()
+    genres = requested_genres()
+    state = request.args.get('state')
+    try:
+        page = venue_areas(after=after, before=before, genres=genres,
+                           state=state)
+    except ValueError:
+        abort(400)
+    cache_depends('venues')
 
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=page.items, page=page,
+                           genres=genres, state=state)
 
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
+@read_replica
 def search_venues():
     data = []
 
-    search_term = request.form.get('search_term', '')
-    result = Venue.query.filter(
-        Venue.name.ilike('%' + search_term + '%')).all()
+    search_term = request.values.get('search_term', '')
+    genres = requested_genres()
+    after, before = page_cursors()
+    try:
+        total, page = search(Venue, search_term, after, before,
+                             genres=genres)
+    except ValueError:
+        abort(400)
+    result = page.items
 
     for venue in result:
 
-        shows = db.session.query(Show).filter(Show.venue_id == venue.id).all()
-
         data.append(
             {
                 "id": venue.id,
                 "name": venue.name,
-                "num_upcoming_shows": len(upcoming_shows(shows, 'artist')),
+                "num_upcoming_shows": venue.num_upcoming_shows,
             }
         )
 
     response = {
 
-        "count": len(data),
-        "data": data
+        "count": total,
+        "data": data,
+        "page": page
 
     }
     return render_template(
         'pages/search_venues.html',
         results=response,
-        search_term=request.form.get(
-            'search_term',
-            ''))
+        search_term=search_term,
+        genres=genres)
 
 
 @app.route('/venues/<int:venue_id>')
+@read_replica
+@conditional_page(venue_version)
+@cached_page
 def show_venue(venue_id):
 
-    data = []
-    venues = Venue.query.get(venue_id)
-    shows = db.session.query(Show).join(
-        Artist).filter(Show.venue_id == venue_id).all()
-    #shows = db.session.query(Show).filter(Show.venue_id == venues.id).all()
-    past = past_shows(shows, 'artist')
-    upcoming = upcoming_shows(shows, 'artist')
-
-    data = {
+    venues = load_profile(Venue, 'detail').get_or_404(venue_id)
+    data = venue_data(venues, list(venues.genres))
+    data.update(show_history('venue', venues))
+    depends_on_shows('venue', data)
+
+    return render_template('pages/show_venue.html', venue=data)
+
+
+def venue_data(venues, genres):
+    # the detail page fields of a Venue (or a row of its columns)
+    return {
         "id": venues.id,
         "name": venues.name,
-        "genres": venues.genres,
+        "genres": genres,
         "address": venues.address,
         "city": venues.city,
         "state": venues.state,
@@ -210,13 +202,39 @@ def show_venue(venue_id):
             't',
             'True') else False,
         "seeking_description": venues.seeking_description,
-        "past_shows": past,
-        "upcoming_shows": upcoming,
-        "past_shows_count": len(past),
-        "upcoming_shows_count": len(upcoming),
     }
 
-    return render_template('pages/show_venue.html', venue=data)
+
+def depends_on_shows(kind, data):
+    # a detail page shows its own entity, the other side of each listed
+    # show, and is stale once its next upcoming show starts
+    other = 'artist' if kind == 'venue' else 'venue'
+    cache_depends(entity_tag(kind, data['id']), *[
+        entity_tag(other, getattr(show, other + '_id'))
+        for show in data['past_shows'] + data['upcoming_shows']])
+    if data['upcoming_shows']:
+        cache_until(data['upcoming_shows'][0].start_time)
+
+
+@app.route('/venues/<int:venue_id>/shows/<any(past, upcoming):when>')
+@read_replica
+def venue_show_history(venue_id, when):
+
+    venue = load_profile(Venue, 'list').get_or_404(venue_id)
+
+    return render_show_history('venue', venue, when)
+
+
+def render_show_history(kind, owner, when):
+    # "load more" pages continuing a detail page's past or upcoming shows.
+    after, before = page_cursors()
+    try:
+        page = show_slice(kind, owner.id, when, after=after, before=before)
+    except ValueError:
+        abort(400)
+
+    return render_template('pages/show_history.html', kind=kind,
+                           owner=owner, when=when, page=page)
 
 #----------------------------------------------------------------------------#
 #  Create Venue
@@ -253,7 +271,7 @@ def create_venue_submission():
     except BaseException:
 
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('Venue %s could not be listed', form.name.data)
         flash('An error occurred. Venue ' +
               form.name.data + ' could not be listed.')
 
@@ -273,7 +291,7 @@ def delete_venue(venue_id):
     except BaseException:
         db.session.rollback()
         flash('An error occurred. Venue could not be deleted.')
-        print(sys.exc_info())
+        app.logger.exception('Venue %s could not be deleted', venue_id)
 
     finally:
         db.session.close()
@@ -287,67 +305,85 @@ def delete_venue(venue_id):
 
 
 @app.route('/artists')
+@read_replica
+@conditional_page(artists_version)
+@cached_page
 def artists():
 
     data = []
-    result = Artist.query.all()
-
-    for artist in result:
+    genres = requested_genres()
+    query = load_profile(Artist, 'list')
+    if genres:
+        query = query.filter(genre_filter(Artist, genres))
+    page = paginate(query, (Artist.id,))
+    cache_depends('artists')
+
+    for artist in page.items:
         data.append({
             "id": artist.id,
             "name": artist.name
         })
 
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=data, page=page,
+                           genres=genres)
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
+@read_replica
 def search_artists():
 
     data = []
-    search_term = request.form.get('search_term', '')
-    result = Artist.query.filter(
-        Artist.name.ilike('%' + search_term + '%')).all()
+    search_term = request.values.get('search_term', '')
+    genres = requested_genres()
+    after, before = page_cursors()
+    try:
+        total, page = search(Artist, search_term, after, before,
+                             genres=genres)
+    except ValueError:
+        abort(400)
+    result = page.items
 
     for artist in result:
 
-        shows = db.session.query(Venue).join(
-            Artist).filter(Show.artist == artist.id).all()
-
         data.append(
             {
                 "id": artist.id,
                 "name": artist.name,
-                "num_upcoming_shows": len(upcoming_shows(shows, 'venue')),
+                "num_upcoming_shows": artist.num_upcoming_shows,
             }
         )
     response = {
-        "count": (len(data)),
-        "data": data
+        "count": total,
+        "data": data,
+        "page": page
     }
     return render_template(
         'pages/search_artists.html',
         results=response,
-        search_term=request.form.get(
-            'search_term',
-            ''))
+        search_term=search_term,
+        genres=genres)
 
 
 @app.route('/artists/<int:artist_id>')
+@read_replica
+@conditional_page(artist_version)
+@cached_page
 def show_artist(artist_id):
 
-    data = []
+    artists = load_profile(Artist, 'detail').get_or_404(artist_id)
+    data = artist_data(artists, list(artists.genres))
+    data.update(show_history('artist', artists))
+    depends_on_shows('artist', data)
+
+    return render_template('pages/show_artist.html', artist=data)
 
-    artists = Artist.query.get(artist_id)
-    shows = db.session.query(Show).join(Venue).filter(
-        Show.artist_id == artist_id).all()
-    past = past_shows(shows, 'venue')
-    upcoming = upcoming_shows(shows, 'venue')
 
-    data = {
+def artist_data(artists, genres):
+    # the detail page fields of an Artist (or a row of its columns)
+    return {
         "id": artists.id,
         "name": artists.name,
-        "genres": artists.genres,
+        "genres": genres,
         "city": artists.city,
         "state": artists.state,
         "phone": artists.phone,
@@ -359,13 +395,16 @@ def show_artist(artist_id):
             'True') else False,
         "seeking_description": artists.seeking_description,
         "image_link": artists.image_link,
-        "past_shows": past,
-        "upcoming_shows": upcoming,
-        "past_shows_count": len(past),
-        "upcoming_shows_count": len(upcoming),
     }
 
-    return render_template('pages/show_artist.html', artist=data)
+
+@app.route('/artists/<int:artist_id>/shows/<any(past, upcoming):when>')
+@read_replica
+def artist_show_history(artist_id, when):
+
+    artist = load_profile(Artist, 'list').get_or_404(artist_id)
+
+    return render_show_history('artist', artist, when)
 
 
 #----------------------------------------------------------------------------#
@@ -376,7 +415,8 @@ def show_artist(artist_id):
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
 
-    result = db.session.query(Artist).filter(Artist.id == artist_id).first()
+    result = load_profile(Artist, 'edit').filter(
+        Artist.id == artist_id).first()
     form = ArtistForm(obj=result)
 
     return render_template('forms/edit_artist.html', form=form, artist=result)
@@ -386,14 +426,14 @@ def edit_artist(artist_id):
 def edit_artist_submission(artist_id):
 
     try:
-        artist = Artist.query.get(artist_id)
+        artist = load_profile(Artist, 'edit').get(artist_id)
         form = ArtistForm(request.form)
         form.populate_obj(artist)
         db.session.commit()
 
     except BaseException:
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('Artist %s could not be edited', artist_id)
 
     finally:
         db.session.close()
@@ -404,7 +444,8 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
 
-    result = db.session.query(Venue).filter(Venue.id == venue_id).first()
+    result = load_profile(Venue, 'edit').filter(
+        Venue.id == venue_id).first()
     form = VenueForm(obj=result)
 
     return render_template('forms/edit_venue.html', form=form, venue=result)
@@ -415,7 +456,7 @@ def edit_venue_submission(venue_id):
 
     try:
 
-        venues = Venue.query.get(venue_id)
+        venues = load_profile(Venue, 'edit').get(venue_id)
         form = VenueForm(request.form)
         form.populate_obj(venues)
         db.session.commit()
@@ -423,7 +464,7 @@ def edit_venue_submission(venue_id):
     except BaseException:
 
         db.session.rollback()
-        print(sys.exc_info())
+        app.logger.exception('Venue %s could not be edited', venue_id)
 
     finally:
         db.session.close()
@@ -464,7 +505,8 @@ def create_artist_submission():
         db.session.rollback()
         flash('An error occurred. Artist ' +
               request.form['name'] + ' could not be listed.')
-        print(sys.exc_info())
+        app.logger.exception('Artist %s could not be listed',
+                             request.form['name'])
 
     finally:
         db.session.close()
@@ -476,29 +518,16 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@read_replica
 def shows():
 
-    data = []
-
-    # num_shows should be aggregated based on number of upcoming shows per
-    # venue.
-
-    result = db.session.query(Show).filter(
-        Show.start_time > datetime.now()).all()
-
-    # flash(result)
-
-    for shows in result:
-        data.append({
-            "venue_id": shows.venue_id,
-            "venue_name": shows.venue.name,
-            "artist_id": shows.artist_id,
-            "artist_name": shows.artist.name,
-            "artist_image_link": shows.artist.image_link,
-            "start_time": str(shows.start_time)
-        })
+    after, before = page_cursors()
+    try:
+        page = upcoming_show_feed(after=after, before=before)
+    except ValueError:
+        abort(400)
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=page.items, page=page)
 
 
 @app.route('/shows/create')
@@ -526,6 +555,7 @@ def create_show_submission():
 
     except BaseException:
         db.session.rollback()
+        app.logger.exception('Show could not be listed')
         flash('Fail, Try Again')
 
     finally:
@@ -534,6 +564,32 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(venues, artists, shows):resource>.<format>')
+@read_replica
+def export_catalog(resource, format):
+    if format not in export_formats():
+        abort(404)
+    return Response(
+        stream_with_context(export(resource, format)),
+        mimetype=MIMETYPES[format],
+        headers={'Content-Disposition': 'attachment; filename=%s.%s' % (
+            resource, format)})
+
+
+@app.route('/status/pool')
+def pool():
+    return jsonify(pool_status(db))
+
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(db),
+                    mimetype='text/plain; version=0.0.4')
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -544,14 +600,8 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+if app.config['LOG_JSON']:
+    init_logging(app)
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -0,0 +1,98 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, request, has_request_context
+from flask.logging import default_handler
+#----------------------------------------------------------------------------#
+# Logging.
+#----------------------------------------------------------------------------#
+
+# Request threads only format a record and put it on an in-memory queue; a
+# single listener thread per process owns the log file, writes and rotates
+# it. With several worker processes give each its own file by putting
+# '{pid}' in LOG_FILE, so no two processes ever rotate the same file.
+
+RECORD_FIELDS = ('request_id', 'route', 'method', 'status', 'latency_ms',
+                 'sql_count')
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'where': '%s:%d' % (record.pathname, record.lineno),
+        }
+        for field in RECORD_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    # runs in the thread that logs, before the record is queued, so the
+    # request's own fields are captured
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.route = request.endpoint
+            record.method = request.method
+            if getattr(record, 'sql_count', None) is None:
+                record.sql_count = g.get('sql_count')
+        return True
+
+
+def init_logging(app):
+    # after init_metrics(), which times requests and counts their statements
+    path = app.config['LOG_FILE'].format(pid=os.getpid())
+    file_handler = RotatingFileHandler(
+        path,
+        maxBytes=app.config['LOG_MAX_BYTES'],
+        backupCount=app.config['LOG_BACKUP_COUNT'],
+        delay=True)
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    records = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.setFormatter(JsonFormatter())
+    queue_handler.addFilter(RequestContextFilter())
+
+    listener = QueueListener(records, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    app.logger.addHandler(queue_handler)
+    # stderr as well only while debugging
+    if not app.debug:
+        app.logger.removeHandler(default_handler)
+
+    @app.before_request
+    def start_request():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+    @app.after_request
+    def log_request(response):
+        if 'request_start' in g:
+            app.logger.info('%s %s %s', request.method, request.full_path,
+                            response.status_code, extra={
+                                'status': response.status_code,
+                                'latency_ms': round(1000 * (
+                                    time.perf_counter() - g.request_start), 3),
+                            })
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+    return listener
@@ -0,0 +1,281 @@
+import asyncio
+import random
+import time
+from datetime import datetime
+from flask import render_template, request, session, abort
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from uvicorn.middleware.wsgi import WSGIMiddleware
+from werkzeug.test import EnvironBuilder
+from app import app, venue_data, artist_data
+from engine import engine_options
+from models import Venue, Artist
+from pagination import keyset_query, keyset_result, page_cursors
+from queries import (
+    venue_area_query, group_areas, upcoming_feed_query, show_slice_query,
+    history_data, VENUE_AREA_KEY, FEED_KEY, SHOW_KEY, SHOWS_PER_PAGE
+)
+from genres import requested_genres, genre_names_query, group_genres
+#----------------------------------------------------------------------------#
+# Async serving mode.
+#----------------------------------------------------------------------------#
+
+# An ASGI entry point. The hot read pages (/venues, /shows and the venue
+# and artist pages) run as async views on the server's event loop, with
+# SQLAlchemy's asyncio engine (asyncpg; aiosqlite for the local SQLite
+# databases), so a worker keeps serving other requests while they wait on
+# the database, and a detail page runs its independent queries at once on
+# separate pooled connections. Every other route is the regular Flask app,
+# run on uvicorn's WSGI thread pool (10 threads per worker) as under a
+# threaded sync server.
+#
+#   uvicorn asgi:application --workers 4
+#
+# The async views go through the app's before/after request hooks
+# (metrics, logging, sessions) and render the same templates, but not
+# through the page cache or ETags: their point is to make the uncached
+# database round trips cheap. Pages with flashed messages are left to the
+# Flask app, which owns clearing them.
+
+# driver used by the async engine per database backend
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_engine(config, uri):
+    url = make_url(uri)
+    url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+    options = engine_options(config, str(url))
+    # same pool settings, on the asyncio flavour of the pool
+    options['poolclass'] = AsyncAdaptedQueuePool
+    connect_args = options.get('connect_args', {})
+    if 'options' in connect_args:
+        # libpq's "-c statement_timeout=N" is a server setting for asyncpg
+        connect_args['server_settings'] = dict(
+            setting[len('-c '):].split('=', 1)
+            for setting in [connect_args.pop('options')])
+    return create_async_engine(url, **options)
+
+
+class AsyncDatabase(object):
+    # the primary and replica async engines of one worker process, created
+    # on its event loop by the first request
+
+    def __init__(self, config):
+        self.config = config
+        self.primary = None
+        self.replicas = []
+
+    def engines(self):
+        if self.primary is None:
+            self.primary = async_engine(
+                self.config, self.config['SQLALCHEMY_DATABASE_URI'])
+            self.replicas = [async_engine(self.config, uri) for uri in
+                             self.config.get('SQLALCHEMY_REPLICA_URIS') or []]
+        return self.primary, self.replicas
+
+    def reader(self):
+        # a replica, unless this user recently wrote (see routing.py)
+        primary, replicas = self.engines()
+        if replicas and time.time() >= session.get('db_primary_until', 0):
+            return random.choice(replicas)
+        return primary
+
+    async def dispose(self):
+        if self.primary is not None:
+            for engine in [self.primary] + self.replicas:
+                await engine.dispose()
+            self.primary, self.replicas = None, []
+
+
+database = AsyncDatabase(app.config)
+
+
+async def fetch(engine, query):
+    # all rows of a Query (or Core select) on a connection of its own
+    async with engine.connect() as connection:
+        result = await connection.execute(getattr(query, 'statement', query))
+        return result.all()
+
+
+#----------------------------------------------------------------------------#
+# Async views.
+#----------------------------------------------------------------------------#
+
+
+async def venues():
+    after, before = page_cursors()
+    genres = requested_genres()
+    state = request.args.get('state')
+    try:
+        query = keyset_query(venue_area_query(genres, state), VENUE_AREA_KEY,
+                             after, before)
+    except ValueError:
+        abort(400)
+    rows = await fetch(database.reader(), query)
+    page = group_areas(keyset_result(rows, VENUE_AREA_KEY, after, before))
+
+    return render_template('pages/venues.html', areas=page.items, page=page,
+                           genres=genres, state=state)
+
+
+async def shows():
+    after, before = page_cursors()
+    try:
+        query = keyset_query(upcoming_feed_query(), FEED_KEY, after, before)
+    except ValueError:
+        abort(400)
+    rows = await fetch(database.reader(), query)
+    page = keyset_result(rows, FEED_KEY, after, before)
+
+    return render_template('pages/shows.html', shows=page.items, page=page)
+
+
+# kind -> (model, page fields, template, template variable)
+DETAIL_PAGES = {
+    'venue': (Venue, venue_data, 'pages/show_venue.html', 'venue'),
+    'artist': (Artist, artist_data, 'pages/show_artist.html', 'artist'),
+}
+
+
+async def detail_page(kind, owner_id):
+    # the owner, its genres and its past and upcoming shows, all at once
+    model, page_data, template, name = DETAIL_PAGES[kind]
+    engine = database.reader()
+    now = datetime.now()
+    table = model.__table__
+    owner, genres, past, upcoming = await asyncio.gather(
+        fetch(engine, table.select().where(table.c.id == owner_id)),
+        fetch(engine, genre_names_query(model, [owner_id])),
+        fetch(engine, keyset_query(
+            show_slice_query(kind, owner_id, 'past', now), SHOW_KEY,
+            descending=True, per_page=SHOWS_PER_PAGE)),
+        fetch(engine, keyset_query(
+            show_slice_query(kind, owner_id, 'upcoming', now), SHOW_KEY,
+            per_page=SHOWS_PER_PAGE)))
+    if not owner:
+        abort(404)
+
+    data = page_data(owner[0], group_genres(genres).get(owner_id, []))
+    data.update(history_data(
+        owner[0],
+        keyset_result(past, SHOW_KEY, per_page=SHOWS_PER_PAGE),
+        keyset_result(upcoming, SHOW_KEY, per_page=SHOWS_PER_PAGE)))
+    return render_template(template, **{name: data})
+
+
+async def show_venue(venue_id):
+    return await detail_page('venue', venue_id)
+
+
+async def show_artist(artist_id):
+    return await detail_page('artist', artist_id)
+
+
+# Flask endpoint -> async view with the same URL arguments
+ASYNC_VIEWS = {
+    'venues': venues,
+    'shows': shows,
+    'show_venue': show_venue,
+    'show_artist': show_artist,
+}
+
+
+#----------------------------------------------------------------------------#
+# ASGI application.
+#----------------------------------------------------------------------------#
+
+
+def wsgi_environ(scope):
+    headers = [(name.decode('latin-1'), value.decode('latin-1'))
+               for name, value in scope['headers']]
+    host = dict((name.lower(), value) for name, value in headers).get(
+        'host', 'localhost')
+    environ = EnvironBuilder(
+        path=scope['path'],
+        base_url='%s://%s%s' % (scope.get('scheme', 'http'), host,
+                                scope.get('root_path', '')),
+        query_string=scope['query_string'].decode('latin-1'),
+        method=scope['method'],
+        headers=headers).get_environ()
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    return environ
+
+
+class AsyncServing(object):
+
+    def __init__(self, app, views):
+        self.app = app
+        self.views = views
+        self.wsgi = WSGIMiddleware(app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            environ = wsgi_environ(scope)
+            try:
+                endpoint, args = self.app.url_map.bind_to_environ(
+                    environ).match()
+            except Exception:
+                endpoint = None
+            view = self.views.get(endpoint)
+            if view is not None:
+                response = await self.dispatch(view, args, environ)
+                if response is not None:
+                    return await self.respond(scope, response, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def dispatch(self, view, args, environ):
+        # Flask's full_dispatch_request with an awaited view; None leaves
+        # the request to the Flask app
+        ctx = self.app.request_context(environ)
+        ctx.push()
+        error = None
+        try:
+            if '_flashes' in session:
+                return None
+            try:
+                try:
+                    rv = self.app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**args)
+                except Exception as e:
+                    rv = self.app.handle_user_exception(e)
+                return self.app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                return self.app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+
+    async def respond(self, scope, response, send):
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b'' if scope['method'] == 'HEAD' else response.get_data(),
+        })
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await database.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AsyncServing(app, ASYNC_VIEWS)
+# the plain Flask app under the same server, for comparing the two modes
+wsgi_application = WSGIMiddleware(app)
@@ -0,0 +1,564 @@
+import argparse
+import json
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+#----------------------------------------------------------------------------#
+# Benchmarks.
+#----------------------------------------------------------------------------#
+
+# Drives every route in app.py through the Flask test client against a
+# database filled by seed.py and reports latency percentiles and SQL
+# statements per route plus the process' peak RSS. Results can be saved as
+# a baseline; later runs are compared against it and exit non-zero when a
+# route issues more statements or answers with a different mix of statuses
+# than in bench-baseline.json (committed, for 1k shows on SQLite), or got
+# slower than in the latency baseline that --save-baseline also writes to
+# the temp directory, since latencies only compare on the same machine.
+#
+#   python bench.py --scale 1k --save-baseline
+#   python bench.py --scale 1k
+#   python bench.py --scale 100k --database postgresql://localhost/fyyur_bench
+#
+# The database defaults to a SQLite file in the temp directory, which is
+# created and seeded on first use (--reseed starts over). For Postgres run
+# `flask db upgrade` against it first so the search indexes exist.
+#
+# --load instead serves the read pages with uvicorn, once through the async
+# views of asgi.py and once through the plain Flask app, and reports the
+# requests per second each sustains under --concurrency clients, the lowest
+# rate over any quarter of the run and the connection pool's timeouts and
+# longest checkout wait (needs uvicorn and httpx, plus aiosqlite for SQLite
+# or asyncpg for Postgres). The pool check runs 200 clients against
+# Postgres, set up with the DB_* settings of config.py:
+#
+#   python bench.py --scale 100k --load --workers 2 --concurrency 32
+#   python bench.py --scale 100k --load --concurrency 200 \
+#       --database postgresql://localhost/fyyur_bench
+#
+# --datetimes times the template datetime filter against the implementation
+# it replaced, over timestamps spread across a few show slots (as pages see
+# them) and over all distinct ones, and checks both give the same text.
+#
+#   python bench.py --datetimes
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'bench-baseline.json')
+# routes that change data are run last, against fresh rows of their own
+WRITE_METHODS = ('POST', 'DELETE')
+
+
+def percentile(samples, p):
+    # nearest rank
+    samples = sorted(samples)
+    return samples[max(0, int(round(p / 100.0 * len(samples))) - 1)]
+
+
+def peak_rss():
+    # bytes, or None where the resource module is missing (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def form_data(endpoint, rng, venue_id, artist_id, resource=None):
+    # valid form posts (JSON bodies for the API) for the routes that take one
+    if endpoint == 'api.create_resource':
+        endpoint = {'venues': 'create_venue_submission',
+                    'artists': 'create_artist_submission'}[resource]
+    n = rng.randrange(10 ** 9)
+    common = {
+        'city': 'Austin',
+        'state': 'TX',
+        'phone': '300-%09d' % n,
+        'genres': ['Jazz', 'Folk'],
+        'image_link': 'https://example.com/%d.png' % n,
+        'facebook_link': 'https://www.facebook.com/bench%d' % n,
+        'website_link': 'https://bench%d.example.com' % n,
+        'seeking_description': '',
+    }
+    if endpoint in ('create_venue_submission', 'edit_venue_submission'):
+        return dict(common, name='Bench Venue %d' % n, address='1 Main St')
+    if endpoint in ('create_artist_submission', 'edit_artist_submission'):
+        return dict(common, name='Bench Artist %d' % n)
+    if endpoint == 'create_show_submission':
+        return {'venue_id': venue_id, 'artist_id': artist_id,
+                'start_time': '2030-01-01 20:00:00'}
+    if endpoint in ('search_venues', 'search_artists'):
+        return {'search_term': rng.choice(['hall', 'band', 'jazz', 'ne'])}
+    return None
+
+
+def url_args(rule, rng, venues, artists):
+    args = {}
+    # /api/v1/<resource>/<item_id>, /export/<resource>.<format>: a venue or
+    # an artist
+    if 'resource' in rule.arguments:
+        args['resource'] = rng.choice(['venues', 'artists'])
+    for name in rule.arguments:
+        if name == 'venue_id':
+            args[name] = rng.choice(venues)
+        elif name == 'artist_id':
+            args[name] = rng.choice(artists)
+        elif name == 'when':
+            args[name] = rng.choice(['past', 'upcoming'])
+        elif name == 'item_id':
+            args[name] = rng.choice(
+                venues if args['resource'] == 'venues' else artists)
+        elif name == 'format':
+            args[name] = rng.choice(['csv', 'ndjson'])
+        elif name == 'resource':
+            pass
+        else:
+            raise ValueError('bench.py does not know how to fill <%s> in %s'
+                             % (name, rule.rule))
+    return args
+
+
+def routes(app):
+    # (endpoint, method, rule) for every route, reads first
+    found = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            found.append((rule.endpoint, method, rule))
+    return sorted(found, key=lambda route: (
+        route[1] in WRITE_METHODS, route[0], route[1]))
+
+
+def run(app, db, requests, seed):
+    from flask import url_for
+    from sqlalchemy import event
+    from models import Venue, Artist
+
+    rng = random.Random(seed)
+    venues = [row[0] for row in db.session.query(Venue.id).limit(1000)]
+    artists = [row[0] for row in db.session.query(Artist.id).limit(1000)]
+    db.session.remove()
+
+    statements = []
+
+    def count(*args):
+        if statements:
+            statements[-1] += 1
+    event.listen(db.engine, 'before_cursor_execute', count)
+
+    client = app.test_client()
+    results = {}
+    for endpoint, method, rule in routes(app):
+        latencies, queries, statuses = [], [], {}
+        # the first request of each route warms up templates and caches
+        for i in range(requests + 1):
+            args = url_args(rule, rng, venues, artists)
+            if endpoint == 'delete_venue':
+                # delete rows created by the create_venue runs, not seed data
+                created = db.session.query(Venue.id).filter(
+                    Venue.name.like('Bench Venue %')).first()
+                db.session.remove()
+                if created is None:
+                    break
+                args['venue_id'] = created[0]
+            with app.test_request_context():
+                url = url_for(endpoint, **args)
+            data = form_data(endpoint, rng, rng.choice(venues),
+                             rng.choice(artists), args.get('resource')
+                             ) if method == 'POST' else None
+            if endpoint.startswith('api.'):
+                body = {'json': data}
+            else:
+                body = {'data': data}
+
+            statements.append(0)
+            start = time.perf_counter()
+            response = client.open(url, method=method, **body)
+            if i == 0:
+                continue
+            latencies.append(time.perf_counter() - start)
+            queries.append(statements[-1])
+            statuses[response.status_code] = statuses.get(
+                response.status_code, 0) + 1
+        if not latencies:
+            continue
+        results['%s %s' % (method, rule.rule)] = {
+            'p50_ms': 1000 * percentile(latencies, 50),
+            'p95_ms': 1000 * percentile(latencies, 95),
+            'p99_ms': 1000 * percentile(latencies, 99),
+            'queries': max(queries),
+            'statuses': dict((str(k), v) for k, v in statuses.items()),
+        }
+    event.remove(db.engine, 'before_cursor_execute', count)
+    return results
+
+
+#----------------------------------------------------------------------------#
+# Load comparison.
+#----------------------------------------------------------------------------#
+
+# mode -> uvicorn application
+LOAD_MODES = (
+    ('async', 'asgi:application'),
+    ('sync', 'asgi:wsgi_application'),
+)
+
+
+def load_paths(db, rng, count):
+    # a mix of the pages asgi.py serves asynchronously
+    from models import Venue, Artist
+    venues = [row[0] for row in db.session.query(Venue.id).limit(1000)]
+    artists = [row[0] for row in db.session.query(Artist.id).limit(1000)]
+    db.session.remove()
+    pages = [lambda: '/venues', lambda: '/shows',
+             lambda: '/venues/%d' % rng.choice(venues),
+             lambda: '/artists/%d' % rng.choice(artists)]
+    return [pages[i % len(pages)]() for i in range(count)]
+
+
+def serve(application, database, port, workers):
+    # uvicorn in its own process group, so stop() reaches its workers too
+    import subprocess
+    import urllib.request
+    env = dict(os.environ, DATABASE_URL=database, CACHE_BACKEND='',
+               LOG_FILE=os.path.join(tempfile.gettempdir(),
+                                     'fyyur-bench-{pid}.log'))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', application, '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        start_new_session=True)
+    deadline = time.time() + 30
+    while True:
+        try:
+            urllib.request.urlopen('http://127.0.0.1:%d/' % port, timeout=1)
+            return server
+        except Exception:
+            if server.poll() is not None or time.time() > deadline:
+                stop(server, signal.SIGKILL)
+                raise RuntimeError('uvicorn %s did not start' % application)
+            time.sleep(0.2)
+
+
+def stop(server, signum=signal.SIGTERM):
+    # the uvicorn supervisor waits for its workers without signalling them
+    os.killpg(server.pid, signum)
+    server.wait()
+
+
+async def drive(port, paths, concurrency):
+    # GET every path with `concurrency` requests in flight
+    import asyncio
+    import httpx
+
+    latencies, finished, statuses = [], [], {}
+    queue = list(reversed(paths))
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async def client(session):
+        while queue:
+            path = queue.pop()
+            start = time.perf_counter()
+            response = await session.get(path)
+            latencies.append(time.perf_counter() - start)
+            finished.append(time.perf_counter())
+            statuses[response.status_code] = statuses.get(
+                response.status_code, 0) + 1
+
+    async with httpx.AsyncClient(base_url='http://127.0.0.1:%d' % port,
+                                 limits=limits, timeout=60) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session) for i in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    rates = quarter_rates(start, finished, elapsed)
+    return elapsed, rates, latencies, statuses
+
+
+def quarter_rates(start, finished, elapsed):
+    # requests per second in each quarter of the run, to see whether the
+    # throughput holds or sags as connections run out
+    counts = [0] * 4
+    for end in finished:
+        counts[min(3, int(4 * (end - start) / elapsed))] += 1
+    return [count / (elapsed / 4) for count in counts]
+
+
+def pool_report(port):
+    # /status/pool of whichever worker answers: the checkouts that timed
+    # out and the longest wait for a connection of the sync engine's pool
+    import urllib.request
+    with urllib.request.urlopen(
+            'http://127.0.0.1:%d/status/pool' % port, timeout=10) as response:
+        status = json.loads(response.read())
+    if 'timeouts' not in status or status['pool'] != 'TimedQueuePool':
+        return status['pool']
+    return '%s timeouts:%d max wait:%.1fms' % (
+        status['pool'], status['timeouts'],
+        1000 * status['max_wait_seconds'])
+
+
+def load(db, database, args):
+    import asyncio
+    rng = random.Random(args.seed)
+    paths = load_paths(db, rng, args.requests * args.concurrency)
+    print('%-6s %10s %10s %8s %8s  %s' % (
+        'mode', 'req/s', 'min req/s', 'p50 ms', 'p99 ms', 'statuses'))
+    for mode, application in LOAD_MODES:
+        server = serve(application, database, args.port, args.workers)
+        try:
+            # warm up every worker's pools and templates
+            asyncio.run(drive(args.port, paths[:4 * args.concurrency],
+                              args.concurrency))
+            elapsed, rates, latencies, statuses = asyncio.run(
+                drive(args.port, paths, args.concurrency))
+            pool = pool_report(args.port)
+        finally:
+            stop(server)
+        print('%-6s %10.1f %10.1f %8.1f %8.1f  %s  %s' % (
+            mode, len(latencies) / elapsed, min(rates),
+            1000 * percentile(latencies, 50), 1000 * percentile(latencies, 99),
+            ' '.join('%s:%d' % item for item in sorted(statuses.items())),
+            pool))
+    return 0
+
+
+def legacy_format_datetime(value, format='medium'):
+    # app.format_datetime before patterns and results were cached
+    import babel.dates
+    import dateutil.parser
+    from datetime import datetime
+    if isinstance(value, datetime):
+        date = value
+    else:
+        date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def datetime_samples(rng, count, slots=None):
+    # `count` show times over a year, drawn from `slots` distinct ones
+    # (all distinct when None)
+    from datetime import datetime, timedelta
+    start = datetime(2030, 1, 1, 18)
+
+    def sample():
+        return start + timedelta(minutes=30 * rng.randrange(365 * 48))
+    if slots is None:
+        return [sample() for i in range(count)]
+    times = [sample() for i in range(slots)]
+    return [rng.choice(times) for i in range(count)]
+
+
+def datetimes(format_datetime, count, seed):
+    # seconds for each implementation per sample set; exit non-zero if
+    # they disagree
+    rng = random.Random(seed)
+    status = 0
+    print('%-24s %10s %10s' % ('%d timestamps' % count, 'legacy s', 'app s'))
+    for name, slots in (('2000 show slots', 2000), ('all distinct', None)):
+        values = datetime_samples(rng, count, slots)
+        timings, outputs = [], []
+        for implementation in (legacy_format_datetime, format_datetime):
+            started = time.perf_counter()
+            outputs.append([implementation(value, 'full')
+                            for value in values])
+            timings.append(time.perf_counter() - started)
+        print('%-24s %10.2f %10.2f' % (name, timings[0], timings[1]))
+        if outputs[0] != outputs[1]:
+            print('MISMATCH %s: the implementations disagree' % name)
+            status = 1
+    return status
+
+
+def status_mix(statuses):
+    # share of each status code, comparable across --requests counts
+    total = float(sum(statuses.values())) or 1
+    return dict((str(status), round(count / total, 3))
+                for status, count in statuses.items())
+
+
+def regressions(results, baseline):
+    # statement counts and status mixes, the same on any machine
+    found = []
+    for route, current in sorted(results.items()):
+        before = baseline.get('routes', {}).get(route)
+        if before is None:
+            continue
+        # e.g. a route that now fails, redirects or 404s some of the time
+        if status_mix(current['statuses']) != status_mix(before['statuses']):
+            found.append('%s: statuses %s, baseline %s' % (
+                route, status_text(current['statuses']),
+                status_text(before['statuses'])))
+        if current['queries'] > before['queries']:
+            found.append('%s: %d statements, baseline %d' % (
+                route, current['queries'], before['queries']))
+    return found
+
+
+def slowdowns(results, baseline, tolerance):
+    # latencies, only meaningful against a run on the same machine
+    found = []
+    for route, current in sorted(results.items()):
+        before = baseline.get('routes', {}).get(route)
+        if before is None:
+            continue
+        # the median is stable enough to compare across runs; ignore
+        # slowdowns of a couple of milliseconds on fast routes
+        if current['p50_ms'] > max(before['p50_ms'] * (1 + tolerance),
+                                   before['p50_ms'] + 2):
+            found.append('%s: p50 %.1f ms, baseline %.1f ms' % (
+                route, current['p50_ms'], before['p50_ms']))
+    return found
+
+
+def load_baseline(path, scale, database):
+    # the baseline saved at `path`, or None if it is for another scale or
+    # database backend
+    with open(path) as f:
+        baseline = json.load(f)
+    if (baseline.get('scale'), baseline.get('database')) != (scale, database):
+        print('baseline %s is for %s on %s, not compared' % (
+            path, baseline.get('scale'), baseline.get('database')))
+        return None
+    return baseline
+
+
+def save_baseline(path, baseline):
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print('baseline saved to %s' % path)
+
+
+def status_text(statuses):
+    return ' '.join('%s:%d' % (status, count) for status, count in sorted(
+        (str(status), count) for status, count in statuses.items()))
+
+
+def report(results, rss):
+    print('%-52s %8s %8s %8s %7s  %s' % (
+        'route', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'statuses'))
+    for route, r in sorted(results.items()):
+        print('%-52s %8.1f %8.1f %8.1f %7d  %s' % (
+            route, r['p50_ms'], r['p95_ms'], r['p99_ms'], r['queries'],
+            status_text(r['statuses'])))
+    if rss is not None:
+        print('peak RSS %.1f MB' % (rss / 1024.0 / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark every route against generated data.')
+    parser.add_argument('--scale', default='1k',
+                        help='number of shows: 1k, 100k or 1m')
+    parser.add_argument('--database',
+                        help='database URL, default a SQLite file per scale')
+    parser.add_argument('--reseed', action='store_true',
+                        help='regenerate the data even if already seeded')
+    parser.add_argument('--requests', type=int, default=20,
+                        help='requests per route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the page cache on (measures cache hits)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='statement counts and statuses to compare with')
+    parser.add_argument('--latency-baseline',
+                        help='latencies to compare with, default a file per '
+                             'scale and database in the temp directory')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p50 slowdown before flagging, 0.25=25%%')
+    parser.add_argument('--load', action='store_true',
+                        help='compare async and sync serving under uvicorn')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='uvicorn worker processes (--load)')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='requests in flight (--load); --requests is '
+                             'then per client')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--datetimes', type=int, nargs='?', const=100000,
+                        metavar='COUNT',
+                        help='time the datetime filter on COUNT timestamps '
+                             '(default 100000) instead')
+    args = parser.parse_args()
+
+    from seed import SCALES, seed
+    shows = SCALES[args.scale.lower()]
+    database = args.database or 'sqlite:///' + os.path.join(
+        tempfile.gettempdir(), 'fyyur-bench-%s.sqlite' % args.scale.lower())
+    # config.py reads these when app is imported
+    os.environ['DATABASE_URL'] = database
+    os.environ.pop('DATABASE_REPLICA_URLS', None)
+    os.environ['LOG_FILE'] = os.path.join(tempfile.gettempdir(),
+                                          'fyyur-bench-{pid}.log')
+
+    import config
+    config.WTF_CSRF_ENABLED = False
+    # count the statements of production, where a worker runs the jobs
+    config.JOBS_INLINE = False
+    if not args.cache:
+        config.CACHE_BACKEND = None
+    from app import app, db, format_datetime
+    from models import Show
+    if args.datetimes:
+        return datetimes(format_datetime, args.datetimes, args.seed)
+    # a failing route shows up as 500s in the report instead of ending the run
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+
+    db.create_all()
+    if args.reseed or db.session.query(Show.id).count() != shows:
+        print('seeding %d shows into %s' % (shows, database))
+        seed(db, shows, args.seed)
+    db.session.remove()
+
+    if args.load:
+        return load(db, database, args)
+
+    results = run(app, db, args.requests, args.seed)
+    rss = peak_rss()
+    report(results, rss)
+
+    backend = database.split(':')[0]
+    counts = {'scale': args.scale, 'database': backend,
+              'routes': dict((route, {'queries': r['queries'],
+                                      'statuses': r['statuses']})
+                             for route, r in results.items())}
+    latencies = {'scale': args.scale, 'database': backend,
+                 'peak_rss': rss, 'routes': results}
+    latency_baseline = args.latency_baseline or os.path.join(
+        tempfile.gettempdir(), 'fyyur-bench-latency-%s-%s.json' % (
+            args.scale.lower(), backend))
+    if args.save_baseline:
+        save_baseline(args.baseline, counts)
+        save_baseline(latency_baseline, latencies)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('no baseline at %s, run with --save-baseline first'
+              % args.baseline)
+        return 1
+    found = []
+    baseline = load_baseline(args.baseline, args.scale, backend)
+    if baseline is not None:
+        found += regressions(results, baseline)
+    if os.path.exists(latency_baseline):
+        baseline = load_baseline(latency_baseline, args.scale, backend)
+        if baseline is not None:
+            found += slowdowns(results, baseline, args.tolerance)
+    else:
+        print('no latency baseline at %s, latencies not compared'
+              % latency_baseline)
+    for line in found:
+        print('REGRESSION ' + line)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
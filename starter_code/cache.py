@@ -0,0 +1,385 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, session, g, make_response
+from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from app import app, db
+from models import Venue, Artist, Show, PageVersion
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# Rendered pages are cached per request path (with the query arguments they
+# read, CACHE_KEY_ARGS) and page version (see conditional.py), along with
+# the tags of every entity they show: 'venue:<id>' and 'artist:<id>' for
+# detail pages, 'venues' and 'artists' for the listings. Commits bump the
+# version rows of their tags in the database, which every process reads, so
+# a commit made anywhere retires the entries of the old version. The
+# process that commits also invalidates its tags in its own cache at once:
+# a tag's invalidation time is the last time it was invalidated and an
+# entry is only valid while it is newer than all of its tags, so a page
+# rendered from data that was committed over mid-render is never served.
+
+
+class MemoryCache(object):
+    # In-process LRU; each worker process has its own copy.
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, tags, created, expires = entry
+            if time.time() >= expires or any(
+                    self.tags.get(tag, 0) >= created for tag in tags):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags, created, expires):
+        with self.lock:
+            if any(self.tags.get(tag, 0) >= created for tag in tags):
+                return
+            self.entries[key] = (value, tags, created, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, tags):
+        now = time.time()
+        with self.lock:
+            for tag in tags:
+                self.tags[tag] = now
+
+
+class FileCache(object):
+    # Shared by every worker on a host: one JSON file per entry and one
+    # version file per invalidated tag, both replaced atomically. Every
+    # maxsize // 10 writes a process prunes the directory back to maxsize
+    # entries, oldest first, and drops files older than the TTL: no entry
+    # outlives it, so neither can a tag invalidation still matter.
+
+    def __init__(self, directory, maxsize=1024, ttl=60):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prune_every = max(1, maxsize // 10)
+        self.writes = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'tags'), exist_ok=True)
+
+    def path(self, kind, name):
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        if kind == 'tags':
+            return os.path.join(self.directory, 'tags', digest)
+        return os.path.join(self.directory, digest)
+
+    def write(self, path, data):
+        tmp = '%s.%d.%d' % (path, os.getpid(), threading.get_ident())
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def version(self, tag):
+        try:
+            with open(self.path('tags', tag)) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def get(self, key):
+        try:
+            with open(self.path('entries', key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['key'] != key or time.time() >= entry['expires'] or any(
+                self.version(tag) >= entry['created'] for tag in entry['tags']):
+            return None
+        return entry['value']
+
+    def set(self, key, value, tags, created, expires):
+        if any(self.version(tag) >= created for tag in tags):
+            return
+        self.write(self.path('entries', key), json.dumps({
+            'key': key,
+            'value': value,
+            'tags': sorted(tags),
+            'created': created,
+            'expires': expires,
+        }))
+        with self.lock:
+            self.writes += 1
+            due = self.writes % self.prune_every == 0
+        if due:
+            self.prune()
+
+    def files(self, directory):
+        # (mtime, path) of the files in `directory`, skipping any removed
+        # by another process meanwhile
+        found = []
+        for entry in os.scandir(directory):
+            try:
+                if entry.is_file():
+                    found.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+        return found
+
+    def prune(self, now=None):
+        # returns how many files were removed
+        if now is None:
+            now = time.time()
+        stale = now - self.ttl
+        entries = sorted(self.files(self.directory))
+        fresh = [path for mtime, path in entries if mtime >= stale]
+        removed = [path for mtime, path in entries if mtime < stale]
+        removed += fresh[:max(0, len(fresh) - self.maxsize)]
+        removed += [path for mtime, path in self.files(
+            os.path.join(self.directory, 'tags')) if mtime < stale]
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(removed)
+
+    def invalidate(self, tags):
+        now = repr(time.time())
+        for tag in tags:
+            self.write(self.path('tags', tag), now)
+
+
+# query arguments the cached pages read (page cursors and listing filters)
+CACHE_KEY_ARGS = ('after', 'before', 'genre', 'state')
+
+CACHE_BACKENDS = {
+    'memory': lambda config: MemoryCache(config.get('CACHE_SIZE', 1024)),
+    'filesystem': lambda config: FileCache(
+        config['CACHE_DIR'], config.get('CACHE_SIZE', 1024),
+        config.get('CACHE_TTL', 60)),
+}
+
+
+def page_cache():
+    # the configured backend, created once per process; None when disabled
+    if 'page_cache' not in app.extensions:
+        backend = app.config.get('CACHE_BACKEND')
+        app.extensions['page_cache'] = (
+            CACHE_BACKENDS[backend](app.config) if backend else None)
+    return app.extensions['page_cache']
+
+
+def page_key():
+    # the request path with only the query arguments pages read, in a fixed
+    # order, so e.g. tracking parameters do not make pages of their own
+    args = sorted((name, value) for name, value in request.args.items(
+        multi=True) if name in CACHE_KEY_ARGS)
+    if not args:
+        return request.path
+    return '%s?%s' % (request.path, urlencode(args))
+
+
+def entity_tag(kind, entity_id):
+    return '%s:%d' % (kind, entity_id)
+
+
+def cache_depends(*tags):
+    # declare entities the page being rendered shows
+    if 'cache_tags' in g:
+        g.cache_tags.update(tags)
+
+
+def cache_until(when):
+    # cap the cached page's lifetime, e.g. at the next upcoming show
+    if 'cache_expires' in g:
+        g.cache_expires = min(g.cache_expires, time.mktime(when.timetuple()))
+
+
+def cached_page(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = page_cache()
+        # pages render flashed messages, which must never be cached
+        if cache is None or request.method != 'GET' or '_flashes' in session:
+            return view(*args, **kwargs)
+
+        # under @conditional_page the key includes the page's version,
+        # which commits in any process (e.g. a job worker's) move on
+        key = page_key()
+        if g.get('page_version') is not None:
+            key = '%s#%s' % (key, g.page_version)
+        value = cache.get(key)
+        if value is not None:
+            return make_response(value)
+
+        g.cache_tags = set()
+        g.cache_created = time.time()
+        g.cache_expires = g.cache_created + app.config.get('CACHE_TTL', 60)
+        created = g.cache_created
+        if g.get('db_replica') is not None:
+            # a replica may not have caught up with writes committed within
+            # the lag window yet, so those count as newer than the page
+            created -= app.config.get('REPLICA_STICKY_SECONDS', 5)
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and '_flashes' not in session:
+            cache.set(key, response.get_data(as_text=True), g.cache_tags,
+                      created, g.cache_expires)
+        return response
+    return wrapper
+
+
+#----------------------------------------------------------------------------#
+# Invalidation.
+#----------------------------------------------------------------------------#
+
+
+# The tags of a commit also bump their page_version rows, in the same
+# transaction, which is what the ETags of conditional.py hash. Venue and
+# artist pages list the name and image of the other side of their shows, so
+# changing those bumps the pages of every venue/artist they have shows with.
+
+# fields of a venue or artist shown on the other side's pages
+SHOWN_FIELDS = ('name', 'image_link')
+# owner kind -> (its id column on show, the other side's id column)
+SHOW_SIDES = {
+    'venue': (Show.venue_id, Show.artist_id),
+    'artist': (Show.artist_id, Show.venue_id),
+}
+# dialect -> INSERT construct with ON CONFLICT support
+UPSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def object_tags(obj):
+    # tags of every page that renders `obj`, including its previous
+    # venue/artist if a show was moved
+    state = inspect(obj)
+    if isinstance(obj, Venue):
+        return {entity_tag('venue', obj.id), 'venues'}
+    if isinstance(obj, Artist):
+        return {entity_tag('artist', obj.id), 'artists'}
+    if isinstance(obj, Show):
+        tags = {'venues'}
+        for kind in ('venue', 'artist'):
+            history = state.attrs[kind + '_id'].history
+            for value in history.sum() or [getattr(obj, kind + '_id')]:
+                if value is not None:
+                    tags.add(entity_tag(kind, int(value)))
+        return tags
+    return set()
+
+
+def pending_tags(db_session):
+    return db_session.info.setdefault('cache_tags', set())
+
+
+def pending_renames(db_session):
+    # venues/artists whose fields shown on the other side's pages changed
+    return db_session.info.setdefault('cache_renames', {
+        'venue': set(), 'artist': set()})
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_flushed_tags(db_session, flush_context):
+    # new objects already have their ids here, and new/dirty/deleted still
+    # describe what was just flushed
+    tags = pending_tags(db_session)
+    for obj in (list(db_session.new) + list(db_session.dirty) +
+                list(db_session.deleted)):
+        tags.update(object_tags(obj))
+        kind = ('venue' if isinstance(obj, Venue) else
+                'artist' if isinstance(obj, Artist) else None)
+        if kind is not None and obj in db_session.dirty and any(
+                inspect(obj).attrs[name].history.has_changes()
+                for name in SHOWN_FIELDS):
+            pending_renames(db_session)[kind].add(obj.id)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def collect_bulk_tags(orm_execute_state):
+    # Query.delete()/update() skip the flush, so look up the rows they are
+    # about to touch (delete_venue() deletes this way)
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in (Venue, Artist, Show):
+        return
+    statement = orm_execute_state.statement
+    query = orm_execute_state.session.query(mapper.class_)
+    if statement.whereclause is not None:
+        query = query.filter(statement.whereclause)
+    tags = pending_tags(orm_execute_state.session)
+    for obj in query.all():
+        tags.update(object_tags(obj))
+
+
+def renamed_tags(db_session, renames):
+    # pages of the other side of the renamed venues'/artists' shows
+    tags = set()
+    for kind, ids in renames.items():
+        if not ids:
+            continue
+        owner_column, other_column = SHOW_SIDES[kind]
+        other = 'artist' if kind == 'venue' else 'venue'
+        tags.update(entity_tag(other, other_id) for other_id, in
+                    db_session.query(other_column).filter(
+                        owner_column.in_(sorted(ids))).distinct())
+    return tags
+
+
+def bump_versions(db_session, tags, now=None):
+    # one more version for each tag, creating its row on first use; in tag
+    # order, so concurrent commits lock the rows in the same order
+    if now is None:
+        now = datetime.utcnow()
+    table = PageVersion.__table__
+    insert = UPSERTS[db_session.get_bind().dialect.name](table).values([
+        {'tag': tag, 'version': 1, 'changed_at': now}
+        for tag in sorted(tags)])
+    db_session.execute(insert.on_conflict_do_update(
+        index_elements=[table.c.tag],
+        set_={'version': table.c.version + 1,
+              'changed_at': insert.excluded.changed_at}))
+
+
+@event.listens_for(db.session, 'before_commit')
+def bump_committed(db_session):
+    # flush first so the last changes are seen (and collected)
+    db_session.flush()
+    tags = pending_tags(db_session)
+    renames = db_session.info.pop('cache_renames', None)
+    if renames:
+        tags.update(renamed_tags(db_session, renames))
+    if tags:
+        bump_versions(db_session, tags)
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_committed(db_session):
+    tags = db_session.info.pop('cache_tags', None)
+    cache = page_cache()
+    if tags and cache is not None:
+        cache.invalidate(tags)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_rolled_back(db_session):
+    db_session.info.pop('cache_tags', None)
+    db_session.info.pop('cache_renames', None)
@@ -0,0 +1,107 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import request, session, g, make_response
+from queries import detail_version, listing_version
+from cache import page_key
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
+
+# A page's ETag hashes its path (with the query arguments it reads) with the
+# version row of everything it renders: the page_version row its commits
+# bump (see cache.py) and, for a detail page, the owner's own columns,
+# counters included, and whether its next show has started, which moves
+# the page's past/upcoming split before the roll-forward job catches up.
+# That is one primary key lookup, so a matching If-None-Match is answered
+# with 304 before the page's own queries run. Last-Modified is the latest
+# of those changes. The page cache stores pages under their ETag, so any
+# process's commit retires every process's cached copies.
+
+
+def utc(value):
+    # updated_at columns are naive UTC
+    return value.replace(tzinfo=timezone.utc) if value is not None else None
+
+
+def local(value):
+    # start_time is naive local time, like datetime.now()
+    return value.astimezone(timezone.utc) if value is not None else None
+
+
+def latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values).replace(microsecond=0) if values else None
+
+
+def detail_page_version(kind, owner_id):
+    row = detail_version(kind, owner_id)
+    if row is None:
+        return None
+    own, upcoming, past, next_show, version, changed_at = row
+    started = next_show is not None and next_show <= datetime.now()
+    return tuple(row) + (started,), latest(
+        utc(own), utc(changed_at), local(next_show) if started else None)
+
+
+def venue_version(venue_id):
+    return detail_page_version('venue', venue_id)
+
+
+def artist_version(artist_id):
+    return detail_page_version('artist', artist_id)
+
+
+def listing_page_version(tag):
+    row = listing_version(tag)
+    version, changed_at = row
+    return row, latest(utc(changed_at))
+
+
+def venues_version():
+    return listing_page_version('venues')
+
+
+def artists_version():
+    return listing_page_version('artists')
+
+
+def not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 7232)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional_page(version):
+    # `version(**view_args)` -> (version row, last modified) or None, in
+    # which case the view runs unconditionally (e.g. to 404)
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # pages render flashed messages, which must not be validated
+            if request.method != 'GET' or '_flashes' in session:
+                return view(**kwargs)
+            current = version(**kwargs)
+            if current is None:
+                return view(**kwargs)
+
+            row, last_modified = current
+            etag = hashlib.sha1(
+                repr((page_key(), tuple(row))).encode('utf-8')
+            ).hexdigest()
+            # the page cache keys the rendered page by it, see cache.py
+            g.page_version = etag
+
+            if not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(**kwargs))
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
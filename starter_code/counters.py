@@ -0,0 +1,231 @@
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+from app import db
+from models import Venue, Artist, Show
+from cache import pending_tags, entity_tag
+from jobs import enqueue, job_handler, recurring_job
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count, past_shows_count and
+# next_show_at so pages read them instead of counting shows. Whenever a
+# transaction adds, moves or deletes shows, it queues a job (see jobs.py)
+# that recomputes the counters of the venues and artists involved from
+# their shows, once it has committed. As time passes upcoming shows
+# become past ones; the job workers recompute the owners whose next show
+# has started every ROLL_SECONDS (`flask counters roll` does it at once),
+# and `flask counters check --repair` (run daily) fixes any drift, e.g.
+# from concurrent writers or rows changed outside the app.
+
+# seconds between roll-forwards by the job workers
+ROLL_SECONDS = 60
+
+OWNERS = {
+    'venue': (Venue, Show.venue_id),
+    'artist': (Artist, Show.artist_id),
+}
+
+
+def counter_values(kind, now):
+    # the counter columns as correlated subqueries over the owner's shows
+    model, owner_column = OWNERS[kind]
+
+    def shows(column, condition):
+        return db.select([column]).where(
+            owner_column == model.id).where(condition).scalar_subquery()
+
+    return {
+        'upcoming_shows_count': shows(db.func.count(Show.id),
+                                      Show.start_time > now),
+        'past_shows_count': shows(db.func.count(Show.id),
+                                  Show.start_time < now),
+        'next_show_at': shows(db.func.min(Show.start_time),
+                              Show.start_time > now),
+    }
+
+
+def refresh_counters(kind, ids=None, now=None):
+    # recompute the counters of the given venues/artists (all if None);
+    # updated_at is kept since the venue or artist itself did not change
+    if now is None:
+        now = datetime.now()
+    model = OWNERS[kind][0]
+    statement = model.__table__.update().values(
+        updated_at=model.updated_at, **counter_values(kind, now))
+    if ids is not None:
+        if not ids:
+            return
+        statement = statement.where(model.id.in_(sorted(ids)))
+    db.session.execute(statement)
+
+
+#----------------------------------------------------------------------------#
+# Maintenance on write.
+#----------------------------------------------------------------------------#
+
+
+def pending_owners(db_session):
+    return db_session.info.setdefault('counter_owners', {
+        'venue': set(), 'artist': set()})
+
+
+def touch(db_session, kind, ids):
+    # for writes that bypass the ORM, e.g. bulk imports
+    pending_owners(db_session)[kind].update(ids)
+
+
+def show_owners(show):
+    # venue and artist ids of a show, before and after any change to them
+    state = inspect(show)
+    for kind in ('venue', 'artist'):
+        history = state.attrs[kind + '_id'].history
+        for value in history.sum() or [getattr(show, kind + '_id')]:
+            if value is not None:
+                yield kind, int(value)
+        # show.venue = ... only sets venue_id during the flush
+        for owner in state.attrs[kind].history.deleted or ():
+            if owner is not None and owner.id is not None:
+                yield kind, owner.id
+
+
+@event.listens_for(Show.venue_id, 'set', active_history=True)
+@event.listens_for(Show.artist_id, 'set', active_history=True)
+def load_previous_owner(show, value, oldvalue, initiator):
+    # active_history loads the id being replaced even when the show was
+    # expired by a commit, so the old venue/artist is refreshed too
+    pass
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_flushed_shows(db_session, flush_context):
+    owners = pending_owners(db_session)
+    for obj in (list(db_session.new) + list(db_session.dirty) +
+                list(db_session.deleted)):
+        if isinstance(obj, Show):
+            for kind, owner_id in show_owners(obj):
+                owners[kind].add(owner_id)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def collect_bulk_shows(orm_execute_state):
+    # Query.delete()/update() of shows skip the flush
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Show:
+        return
+    statement = orm_execute_state.statement
+    query = orm_execute_state.session.query(Show.venue_id, Show.artist_id)
+    if statement.whereclause is not None:
+        query = query.filter(statement.whereclause)
+    owners = pending_owners(orm_execute_state.session)
+    for venue_id, artist_id in query:
+        owners['venue'].add(venue_id)
+        owners['artist'].add(artist_id)
+
+
+# ahead of cache.py's hook, which bumps the versions of the tags an inline
+# job (JOBS_INLINE) adds
+@event.listens_for(db.session, 'before_commit', insert=True)
+def queue_pending_counters(db_session):
+    # flush first so the last changes are seen (and collected)
+    db_session.flush()
+    owners = db_session.info.pop('counter_owners', None)
+    if owners and any(owners.values()):
+        enqueue(db_session, 'refresh_counters', **dict(
+            (kind, sorted(ids)) for kind, ids in owners.items()))
+
+
+@job_handler('refresh_counters')
+def refresh_counters_job(venue=(), artist=()):
+    # recompute, then drop the cached pages showing the old counts
+    for kind, ids in (('venue', venue), ('artist', artist)):
+        refresh_counters(kind, ids)
+        pending_tags(db.session).update(
+            entity_tag(kind, owner_id) for owner_id in ids)
+        if ids:
+            pending_tags(db.session).add(kind + 's')
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_pending_counters(db_session):
+    db_session.info.pop('counter_owners', None)
+
+
+#----------------------------------------------------------------------------#
+# Roll-forward & consistency check.
+#----------------------------------------------------------------------------#
+
+
+def roll_forward(now=None):
+    # move started shows from upcoming to past; returns owners updated
+    if now is None:
+        now = datetime.now()
+    rolled = 0
+    for kind, (model, owner_column) in OWNERS.items():
+        ids = [owner_id for owner_id, in db.session.query(model.id).filter(
+            model.next_show_at <= now)]
+        refresh_counters(kind, ids, now)
+        pending_tags(db.session).update(
+            entity_tag(kind, owner_id) for owner_id in ids)
+        if ids:
+            pending_tags(db.session).add(kind + 's')
+        rolled += len(ids)
+    return rolled
+
+
+@recurring_job('roll_counters', ROLL_SECONDS)
+def roll_counters_job():
+    roll_forward()
+
+
+def drifted(kind, now=None):
+    # (id, stored counters, actual counters) of every owner that is off
+    if now is None:
+        now = datetime.now()
+    model = OWNERS[kind][0]
+    actual = counter_values(kind, now)
+    stored = [model.upcoming_shows_count, model.past_shows_count,
+              model.next_show_at]
+    expected = [actual['upcoming_shows_count'], actual['past_shows_count'],
+                actual['next_show_at']]
+    return [(row[0], tuple(row[1:4]), tuple(row[4:]))
+            for row in db.session.query(model.id, *(stored + expected)).filter(
+                db.or_(*[column.is_distinct_from(value)
+                         for column, value in zip(stored, expected)]))]
+
+
+counters_cli = AppGroup('counters', help='Maintain the show counters.')
+
+
+@counters_cli.command('roll')
+def roll_command():
+    """Move shows that have started from upcoming to past."""
+    rolled = roll_forward()
+    db.session.commit()
+    click.echo('%d venues/artists rolled forward' % rolled)
+
+
+@counters_cli.command('check')
+@click.option('--repair', is_flag=True, help='recompute drifted counters')
+def check_command(repair):
+    """Report (and optionally fix) counters that disagree with the shows."""
+    now = datetime.now()
+    found = 0
+    for kind in OWNERS:
+        rows = drifted(kind, now)
+        found += len(rows)
+        for owner_id, stored, actual in rows:
+            click.echo('%s %d: stored %r, actual %r' % (
+                kind, owner_id, stored, actual))
+        if repair and rows:
+            refresh_counters(kind, [row[0] for row in rows], now)
+            pending_tags(db.session).update(
+                entity_tag(kind, row[0]) for row in rows)
+            pending_tags(db.session).add(kind + 's')
+    db.session.commit()
+    if found and not repair:
+        raise SystemExit(1)
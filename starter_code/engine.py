@@ -0,0 +1,122 @@
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+#----------------------------------------------------------------------------#
+# Engine & connection pool.
+#----------------------------------------------------------------------------#
+
+
+class PoolStats(object):
+    # checkout counters shared by every pool in the process
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connects = 0
+        self.invalidations = 0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self.lock:
+            self.checkouts += not timed_out
+            self.timeouts += timed_out
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long each checkout waited for a connection
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super(TimedQueuePool, self)._do_get()
+        except Exception:
+            pool_stats.record_wait(time.perf_counter() - start, True)
+            raise
+        pool_stats.record_wait(time.perf_counter() - start)
+        return connection
+
+
+@event.listens_for(TimedQueuePool, 'connect')
+def count_connect(dbapi_connection, connection_record):
+    with pool_stats.lock:
+        pool_stats.connects += 1
+
+
+@event.listens_for(TimedQueuePool, 'invalidate')
+def count_invalidate(dbapi_connection, connection_record, exception):
+    with pool_stats.lock:
+        pool_stats.invalidations += 1
+
+
+def engine_options(config, uri=None):
+    # SQLALCHEMY_ENGINE_OPTIONS for the DB_* settings in config.py
+    url = make_url(uri or config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    connect_args = {}
+
+    if config['DB_POOL_MODE'] == 'transaction':
+        # PgBouncer transaction pooling hands each transaction to any server
+        # connection: no server-side prepared statements and no session
+        # level settings (the timeout is applied per transaction instead).
+        if url.get_driver_name() == 'asyncpg':
+            connect_args['statement_cache_size'] = 0
+            connect_args['prepared_statement_cache_size'] = 0
+    elif config['DB_STATEMENT_TIMEOUT']:
+        connect_args['options'] = '-c statement_timeout=%d' % (
+            config['DB_STATEMENT_TIMEOUT'])
+
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def init_engine(app):
+    if (app.config['DB_POOL_MODE'] == 'transaction' and
+            app.config['DB_STATEMENT_TIMEOUT']):
+        @event.listens_for(Engine, 'begin')
+        def set_local_statement_timeout(connection):
+            if connection.engine.dialect.name == 'postgresql':
+                connection.exec_driver_sql(
+                    'SET LOCAL statement_timeout = %d' % (
+                        app.config['DB_STATEMENT_TIMEOUT']))
+
+
+def pool_status(db):
+    # current pool occupancy plus the cumulative checkout counters
+    pool = db.engine.pool
+    status = {
+        'pool': type(pool).__name__,
+        'checkouts': pool_stats.checkouts,
+        'timeouts': pool_stats.timeouts,
+        'wait_seconds': pool_stats.wait_seconds,
+        'max_wait_seconds': pool_stats.max_wait_seconds,
+        'connects': pool_stats.connects,
+        'invalidations': pool_stats.invalidations,
+    }
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+        })
+    return status
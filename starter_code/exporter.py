@@ -0,0 +1,191 @@
+import csv
+import io
+import json
+import click
+from flask.cli import with_appcontext
+from app import db
+from models import Venue, Artist, Show
+from importer import LIST_FIELDS
+from genres import GENRE_LINKS, genre_names
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+# Streams every row of venue, artist or show as CSV, NDJSON or Parquet.
+# Rows are fetched EXPORT_CHUNK_ROWS at a time via a server-side cursor
+# (yield_per) and each chunk is encoded and handed on before the next is
+# fetched, so neither the result set nor the output is ever held whole.
+# CSV and NDJSON use the same layout importer.py reads, so an export can be
+# imported elsewhere. Parquet needs pyarrow; each chunk is one row group.
+#
+#   flask export shows --format parquet --output shows.parquet
+#   curl localhost:5000/export/shows.csv
+
+EXPORT_CHUNK_ROWS = 5000
+
+EXPORTS = {
+    'venues': Venue,
+    'artists': Artist,
+    'shows': Show,
+}
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def export_formats():
+    return sorted(MIMETYPES) if pyarrow is not None else ['csv', 'ndjson']
+
+
+def field_names(model):
+    # the table's columns, then genres for venues and artists
+    names = [column.key for column in model.__table__.columns]
+    if model in GENRE_LINKS:
+        names.append('genres')
+    return names
+
+
+def with_genres(model, chunk):
+    if model not in GENRE_LINKS:
+        return chunk
+    genres = genre_names(model, [row.id for row in chunk])
+    return [tuple(row) + (genres.get(row.id, []),) for row in chunk]
+
+
+def chunks(model):
+    # lists of row tuples in id order, one server-side cursor fetch (and
+    # one genre query) each
+    columns = list(model.__table__.columns)
+    rows = db.session.query(*columns).order_by(model.id).yield_per(
+        EXPORT_CHUNK_ROWS)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == EXPORT_CHUNK_ROWS:
+            yield with_genres(model, chunk)
+            chunk = []
+    if chunk:
+        yield with_genres(model, chunk)
+
+
+def text(value):
+    # datetimes as 'YYYY-MM-DD HH:MM:SS[.ffffff]' and booleans as
+    # 'true'/'false', which is what the forms parse
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value) if value is not None else None
+
+
+def csv_export(model):
+    names = field_names(model)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for chunk in chunks(model):
+        for row in chunk:
+            writer.writerow([
+                ','.join(value or ()) if name in LIST_FIELDS else
+                text(value) for name, value in zip(names, row)])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_export(model):
+    names = field_names(model)
+    for chunk in chunks(model):
+        yield ''.join(json.dumps(dict(zip(names, row)), default=text) + '\n'
+                      for row in chunk)
+
+
+class ChunkSink(object):
+    # write-only file for pyarrow that hands written bytes back in pieces
+
+    def __init__(self):
+        self.pieces = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.pieces.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.pieces)
+        self.pieces = []
+        return data
+
+
+def arrow_type(column):
+    python_type = column.type.python_type
+    if python_type is int:
+        return pyarrow.int64()
+    if python_type is bool:
+        return pyarrow.bool_()
+    if python_type.__name__ == 'datetime':
+        return pyarrow.timestamp('us')
+    return pyarrow.string()
+
+
+def parquet_export(model):
+    fields = [(column.key, arrow_type(column))
+              for column in model.__table__.columns]
+    if model in GENRE_LINKS:
+        fields.append(('genres', pyarrow.list_(pyarrow.string())))
+    schema = pyarrow.schema(fields)
+    sink = ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    for chunk in chunks(model):
+        writer.write_table(pyarrow.Table.from_pydict(dict(
+            (name, [row[i] for row in chunk])
+            for i, (name, type) in enumerate(fields)), schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+EXPORTERS = {
+    'csv': csv_export,
+    'ndjson': ndjson_export,
+    'parquet': parquet_export,
+}
+
+
+def export(resource, format):
+    # generator of str (csv, ndjson) or bytes (parquet) pieces
+    return EXPORTERS[format](EXPORTS[resource])
+
+
+@click.command('export')
+@click.argument('resource', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', type=click.Choice(export_formats()),
+              default='csv')
+@click.option('--output', type=click.File('wb'), default='-',
+              help='file to write, default standard output')
+@with_appcontext
+def export_command(resource, format, output):
+    """Export venues, artists or shows as CSV, NDJSON or Parquet."""
+    for piece in export(resource, format):
+        output.write(piece.encode('utf-8') if isinstance(piece, str)
+                     else piece)
+    db.session.close()
@@ -0,0 +1,182 @@
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+from app import db
+from models import Venue, Artist, Show, UpcomingShow
+from jobs import enqueue, job_handler, recurring_job
+#----------------------------------------------------------------------------#
+# Upcoming shows feed.
+#----------------------------------------------------------------------------#
+
+# /shows reads upcoming_show, which holds every upcoming show together with
+# the venue name, artist name and artist image it renders, so a page is one
+# range scan of its (start_time, id) index with no join. A transaction that
+# adds, moves or deletes shows, or renames a venue or artist, queues a job
+# (see jobs.py) that rewrites the feed rows of those shows, or of all the
+# shows of the renamed venue or artist, once it has committed. Rows of
+# shows that have started are skipped by the reads and removed by the job
+# workers every PRUNE_SECONDS (`flask feed refresh` does it at once);
+# `flask feed rebuild` recomputes the whole table.
+
+# seconds between prunes of started shows by the job workers
+PRUNE_SECONDS = 300
+
+# fields of the venue and artist copied into the feed
+FEED_FIELDS = {
+    'venue': ('name',),
+    'artist': ('name', 'image_link'),
+}
+
+
+def feed_rows(now):
+    # upcoming shows as upcoming_show rows
+    return db.select([
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name,
+        Show.artist_id,
+        Artist.name,
+        Artist.image_link
+    ]).select_from(Show).join(
+        Venue, Venue.id == Show.venue_id
+    ).join(
+        Artist, Artist.id == Show.artist_id
+    ).where(Show.start_time > now)
+
+
+def refresh_feed(show_ids=None, venue_ids=None, artist_ids=None, now=None):
+    # rewrite the feed rows of the given shows and of every show of the
+    # given venues and artists, or the whole feed when none are given
+    if now is None:
+        now = datetime.now()
+    table = UpcomingShow.__table__
+    rows = feed_rows(now)
+    delete = table.delete()
+
+    if not (show_ids is None and venue_ids is None and artist_ids is None):
+        changed, stored = [], []
+        for ids, column, feed_column in (
+                (show_ids, Show.id, table.c.id),
+                (venue_ids, Show.venue_id, table.c.venue_id),
+                (artist_ids, Show.artist_id, table.c.artist_id)):
+            if ids:
+                changed.append(column.in_(sorted(ids)))
+                stored.append(feed_column.in_(sorted(ids)))
+        if not changed:
+            return
+        rows = rows.where(db.or_(*changed))
+        delete = delete.where(db.or_(*stored))
+
+    db.session.execute(delete)
+    db.session.execute(table.insert().from_select(
+        [column.key for column in table.columns], rows))
+
+
+def prune_feed(now=None):
+    # drop the rows of shows that have started; returns how many
+    if now is None:
+        now = datetime.now()
+    return db.session.execute(UpcomingShow.__table__.delete().where(
+        UpcomingShow.start_time <= now)).rowcount
+
+
+#----------------------------------------------------------------------------#
+# Maintenance on write.
+#----------------------------------------------------------------------------#
+
+
+def pending_feed(db_session):
+    # show ids, and venue/artist ids whose shows all need rewriting
+    return db_session.info.setdefault('feed_changes', {
+        'show': set(), 'venue': set(), 'artist': set()})
+
+
+def touch(db_session, kind, ids):
+    # for writes that bypass the ORM, e.g. bulk imports
+    pending_feed(db_session)[kind].update(ids)
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_flushed_changes(db_session, flush_context):
+    changes = pending_feed(db_session)
+    for obj in (list(db_session.new) + list(db_session.dirty) +
+                list(db_session.deleted)):
+        if isinstance(obj, Show):
+            changes['show'].add(obj.id)
+            continue
+        kind = ('venue' if isinstance(obj, Venue) else
+                'artist' if isinstance(obj, Artist) else None)
+        if kind is None or obj in db_session.new:
+            continue
+        state = inspect(obj)
+        if any(state.attrs[name].history.has_changes()
+               for name in FEED_FIELDS[kind]):
+            changes[kind].add(obj.id)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def collect_bulk_changes(orm_execute_state):
+    # Query.delete()/update() of shows skip the flush
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is not Show:
+        return
+    statement = orm_execute_state.statement
+    query = orm_execute_state.session.query(Show.id)
+    if statement.whereclause is not None:
+        query = query.filter(statement.whereclause)
+    pending_feed(orm_execute_state.session)['show'].update(
+        show_id for show_id, in query)
+
+
+@event.listens_for(db.session, 'before_commit')
+def queue_pending_feed(db_session):
+    # flush first so the last changes are seen (and collected)
+    db_session.flush()
+    changes = db_session.info.pop('feed_changes', None)
+    if changes and any(changes.values()):
+        enqueue(db_session, 'refresh_feed', **dict(
+            (kind, sorted(ids)) for kind, ids in changes.items()))
+
+
+@job_handler('refresh_feed')
+def refresh_feed_job(show=(), venue=(), artist=()):
+    refresh_feed(show, venue, artist)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_pending_feed(db_session):
+    db_session.info.pop('feed_changes', None)
+
+
+#----------------------------------------------------------------------------#
+# Scheduled refresh.
+#----------------------------------------------------------------------------#
+
+
+@recurring_job('prune_feed', PRUNE_SECONDS)
+def prune_feed_job():
+    prune_feed()
+
+
+feed_cli = AppGroup('feed', help='Maintain the upcoming shows feed.')
+
+
+@feed_cli.command('refresh')
+def refresh_command():
+    """Remove shows that have started from the feed."""
+    removed = prune_feed()
+    db.session.commit()
+    click.echo('%d started shows removed' % removed)
+
+
+@feed_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the whole feed from the shows."""
+    refresh_feed()
+    db.session.commit()
+    click.echo('%d upcoming shows' % db.session.query(
+        db.func.count(UpcomingShow.id)).scalar())
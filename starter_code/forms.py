@@ -1,4 +1,5 @@
 from datetime import datetime
+from werkzeug.datastructures import MultiDict
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
 from wtforms.validators import DataRequired, AnyOf, URL
@@ -237,3 +238,18 @@ class ArtistForm(Form):
             'seeking_description'
      )
 
+
+def form_data(values):
+    # a dict of JSON values (lists for multiple choices) as the form data a
+    # browser would post, for the API and bulk imports
+    formdata = MultiDict()
+    for name, value in values.items():
+        if isinstance(value, list):
+            for item in value:
+                formdata.add(name, str(item))
+        elif isinstance(value, bool):
+            if value:
+                formdata.add(name, 'y')
+        elif value is not None:
+            formdata.add(name, str(value))
+    return formdata
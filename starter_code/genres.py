@@ -0,0 +1,93 @@
+from datetime import datetime
+from flask import request
+from sqlalchemy import event, inspect
+from app import db
+from models import Venue, Artist, Genre, venue_genre, artist_genre
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+# Genres live in the genre table, linked to venues and artists through
+# venue_genre and artist_genre. A genre filter is a semi-join on the link
+# table's (genre_id, owner) index, so "jazz venues in NY" is one query over
+# that index and ix_venue_state_city.
+
+# model -> (link table, its owner id column)
+GENRE_LINKS = {
+    Venue: (venue_genre, venue_genre.c.venue_id),
+    Artist: (artist_genre, artist_genre.c.artist_id),
+}
+
+
+def requested_genres():
+    # ?genre=Jazz&genre=Folk or ?genre=Jazz,Folk
+    return sorted(set(name.strip()
+                      for value in request.values.getlist('genre')
+                      for name in value.split(',') if name.strip()))
+
+
+def genre_filter(model, names):
+    # venues/artists having any of the named genres
+    link, owner_column = GENRE_LINKS[model]
+    return model.id.in_(db.select([owner_column]).where(
+        link.c.genre_id.in_(db.select([Genre.id]).where(
+            Genre.name.in_(names)))))
+
+
+def genre_match(model, pattern):
+    # venues/artists with a genre whose name is LIKE `pattern` (search)
+    link, owner_column = GENRE_LINKS[model]
+    return model.id.in_(db.select([owner_column]).where(
+        link.c.genre_id.in_(db.select([Genre.id]).where(
+            Genre.name.ilike(pattern, escape='\\')))))
+
+
+def genre_names(model, ids):
+    # {id: [genre names]} for a page of venues or artists in one query
+    if not ids:
+        return {}
+    return group_genres(genre_names_query(model, ids))
+
+
+def genre_names_query(model, ids):
+    link, owner_column = GENRE_LINKS[model]
+    return db.session.query(
+        owner_column, Genre.name
+    ).select_from(link).join(
+        Genre, Genre.id == link.c.genre_id
+    ).filter(owner_column.in_(ids)).order_by(owner_column, Genre.name)
+
+
+def group_genres(rows):
+    # (owner id, name) rows -> {id: [names]}
+    names = {}
+    for owner_id, name in rows:
+        names.setdefault(owner_id, []).append(name)
+    return names
+
+
+def genre_ids(names):
+    # {name: id}, adding the genres not seen before; for Core inserts that
+    # bypass Venue.genres / Artist.genres
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(db.session.query(Genre.name, Genre.id).filter(
+        Genre.name.in_(names)))
+    missing = names - set(ids)
+    if missing:
+        db.session.execute(Genre.__table__.insert(),
+                           [{'name': name} for name in sorted(missing)])
+        ids.update(db.session.query(Genre.name, Genre.id).filter(
+            Genre.name.in_(missing)))
+    return ids
+
+
+@event.listens_for(db.session, 'before_flush')
+def touch_regenred(db_session, flush_context, instances):
+    # changing only the genres issues no UPDATE of the venue or artist row,
+    # so bump updated_at, which the conditional page versions read
+    for obj in db_session.dirty:
+        if (isinstance(obj, (Venue, Artist)) and
+                inspect(obj).attrs.genre_items.history.has_changes()):
+            obj.updated_at = datetime.utcnow()
@@ -0,0 +1,308 @@
+import csv
+import io
+import json
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import DBAPIError
+from app import db
+from models import Venue, Artist, Show
+from forms import VenueForm, ArtistForm, ShowForm, form_data
+from cache import pending_tags, entity_tag
+from counters import touch as touch_counters
+from feed import touch as touch_feed
+from genres import GENRE_LINKS, genre_ids
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# Streams CSV or NDJSON rows into venues, artists or shows. Every row goes
+# through the same form as the create pages. Valid rows are inserted with
+# one executemany per batch, and each batch is committed, so memory stays
+# flat whatever the size of the file. Shows may name their venue and artist
+# ('venue', 'artist') instead of giving ids; names are looked up once per
+# batch. The ids of new venues and artists, needed to link their genres,
+# are read back by their unique phone numbers. Rows that fail are reported
+# by line number and skipped.
+#
+#   flask import shows festival.csv
+#   curl -H 'Content-Type: text/csv' --data-binary @festival.csv \
+#       localhost:5000/api/v1/shows/import
+
+IMPORT_BATCH_SIZE = 1000
+# a report lists at most this many failed rows (all are counted)
+MAX_REPORTED_ERRORS = 1000
+# CSV cells holding several comma separated choices
+LIST_FIELDS = ('genres',)
+
+# resource -> (model, form)
+IMPORTS = {
+    'venues': (Venue, VenueForm),
+    'artists': (Artist, ArtistForm),
+    'shows': (Show, ShowForm),
+}
+FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+
+class ImportReport(object):
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def csv_rows(stream):
+    # (line, values) with empty cells left out
+    reader = csv.DictReader(stream)
+    for row in reader:
+        values = dict((name, value) for name, value in row.items()
+                      if name and value not in ('', None))
+        for name in LIST_FIELDS:
+            if name in values:
+                values[name] = [item.strip() for item in
+                                values[name].split(',') if item.strip()]
+        yield reader.line_num, values
+
+
+def ndjson_rows(stream):
+    # (line, values), or (line, error message) for lines that are not JSON
+    # objects
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            values = json.loads(text)
+        except ValueError as error:
+            yield line, 'invalid JSON: %s' % error
+            continue
+        if not isinstance(values, dict):
+            yield line, 'expected a JSON object'
+            continue
+        yield line, values
+
+
+READERS = {
+    'csv': csv_rows,
+    'ndjson': ndjson_rows,
+}
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_references(batch, report):
+    # fill in venue_id/artist_id of shows that name their venue or artist
+    # and check that the ids exist, with two queries per side per batch
+    for kind, model in (('venue', Venue), ('artist', Artist)):
+        column = kind + '_id'
+        for i, (line, values) in enumerate(batch):
+            # NDJSON rows can name them with any JSON value
+            if (values is not None and column not in values and
+                    kind in values and not isinstance(values[kind], str)):
+                report.error(line, {
+                    kind: ['Give the %s name as text.' % kind]})
+                batch[i] = (line, None)
+        names = set(values[kind] for line, values in batch
+                    if values is not None and kind in values and
+                    column not in values)
+        ids = {}
+        if names:
+            for name, item_id in db.session.query(
+                    model.name, model.id).filter(model.name.in_(names)):
+                ids.setdefault(name, []).append(item_id)
+
+        for i, (line, values) in enumerate(batch):
+            if values is None:
+                continue
+            if column not in values and kind in values:
+                found = ids.get(values[kind], [])
+                if len(found) != 1:
+                    report.error(line, {kind: [
+                        'No %s named %s.' % (kind, values[kind]) if not found
+                        else 'Several %ss are named %s, give %s.' % (
+                            kind, values[kind], column)]})
+                    batch[i] = (line, None)
+                    continue
+                values[column] = found[0]
+            try:
+                values[column] = int(values.get(column))
+            except (TypeError, ValueError):
+                report.error(line, {
+                    column: ['Give %s or %s.' % (column, kind)]})
+                batch[i] = (line, None)
+
+        wanted = set(values[column] for line, values in batch
+                     if values is not None)
+        existing = set(item_id for item_id, in db.session.query(
+            model.id).filter(model.id.in_(wanted))) if wanted else set()
+        for i, (line, values) in enumerate(batch):
+            if values is not None and values[column] not in existing:
+                report.error(line, {column: ['No such %s.' % kind]})
+                batch[i] = (line, None)
+
+
+def insert_rows(model, rows, genres):
+    # shows in one executemany; venues and artists too, then their ids are
+    # read back by phone (unique) in one query to link their genres, all in
+    # one more executemany. Those without a phone go one by one.
+    table = model.__table__
+    if model not in GENRE_LINKS:
+        db.session.execute(table.insert(), [values for line, values in rows])
+        return
+    link, owner_column = GENRE_LINKS[model]
+    batched, single = [], []
+    for line, values in rows:
+        values = dict(values)
+        names = values.pop('genres', None) or []
+        (batched if values.get('phone') else single).append((values, names))
+
+    owners = []
+    if batched:
+        db.session.execute(table.insert(),
+                           [values for values, names in batched])
+        ids = dict(db.session.query(model.phone, model.id).filter(
+            model.phone.in_([values['phone'] for values, names in batched])))
+        owners.extend((ids[values['phone']], names)
+                      for values, names in batched)
+    for values, names in single:
+        owners.append((db.session.execute(
+            table.insert(), values).inserted_primary_key[0], names))
+
+    links = [{owner_column.key: owner_id, 'genre_id': genres[name]}
+             for owner_id, names in owners for name in names]
+    if links:
+        db.session.execute(link.insert(), links)
+
+
+def insert_batch(model, rows, report):
+    # all rows in one savepoint; when the database rejects them (e.g. a
+    # duplicate phone) they are retried one at a time to find the bad ones
+    if not rows:
+        return
+    genres = genre_ids(name for line, values in rows
+                       for name in values.get('genres') or [])
+    try:
+        with db.session.begin_nested():
+            insert_rows(model, rows, genres)
+        report.inserted += len(rows)
+        return
+    except DBAPIError:
+        pass
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                insert_rows(model, [row], genres)
+            report.inserted += 1
+        except DBAPIError as error:
+            report.error(row[0], {'row': [str(error.orig).strip()]})
+
+
+def import_rows(resource, rows, batch_size=IMPORT_BATCH_SIZE):
+    # rows: (line, values dict or error message)
+    model, form_class = IMPORTS[resource]
+    table = model.__table__
+    report = ImportReport()
+
+    for batch in batches(rows, batch_size):
+        report.rows += len(batch)
+        for i, (line, values) in enumerate(batch):
+            if not isinstance(values, dict):
+                report.error(line, {'row': [values]})
+                batch[i] = (line, None)
+        if resource == 'shows':
+            resolve_references(batch, report)
+
+        valid = []
+        for line, values in batch:
+            if values is None:
+                continue
+            form = form_class(form_data(values), meta={'csrf': False})
+            if not form.validate():
+                report.error(line, form.errors)
+                continue
+            row = dict((field.name, field.data) for field in form
+                       if field.name in table.c or field.name in LIST_FIELDS)
+            if resource == 'shows':
+                # ShowForm keeps the ids as text; use the resolved ints
+                row['venue_id'] = values['venue_id']
+                row['artist_id'] = values['artist_id']
+            valid.append((line, row))
+
+        try:
+            if resource == 'shows':
+                # the batch's shows get ids above the current largest
+                last_id = db.session.query(db.func.max(Show.id)).scalar()
+            insert_batch(model, valid, report)
+            tags = pending_tags(db.session)
+            if resource == 'shows':
+                # Core inserts skip the flush hooks that keep these current
+                tags.add('venues')
+                for line, values in valid:
+                    tags.add(entity_tag('venue', values['venue_id']))
+                    tags.add(entity_tag('artist', values['artist_id']))
+                touch_counters(db.session, 'venue',
+                               [values['venue_id'] for line, values in valid])
+                touch_counters(db.session, 'artist',
+                               [values['artist_id'] for line, values in valid])
+                # only the new shows' feed rows, not every show of their
+                # venues (a few more if another writer inserted meanwhile)
+                touch_feed(db.session, 'show', [
+                    show_id for show_id, in db.session.query(Show.id).filter(
+                        Show.id > (last_id or 0))])
+            else:
+                tags.add(resource)
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+
+    db.session.close()
+    return report
+
+
+def import_stream(resource, stream, format):
+    # `stream` is binary; CSV and NDJSON are read as UTF-8 text
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    return import_rows(resource, READERS[format](text))
+
+
+@click.command('import')
+@click.argument('resource', type=click.Choice(sorted(IMPORTS)))
+@click.argument('source', type=click.File('rb'))
+@click.option('--format', type=click.Choice(sorted(READERS)),
+              help='csv or ndjson; guessed from the file name by default')
+@with_appcontext
+def import_command(resource, source, format):
+    """Import venues, artists or shows from a CSV or NDJSON file."""
+    if format is None:
+        format = 'csv' if source.name.endswith('.csv') else 'ndjson'
+    report = import_stream(resource, source, format)
+    click.echo(json.dumps(report.as_dict(), indent=2))
+    if report.failed:
+        raise SystemExit(1)
@@ -0,0 +1,245 @@
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from app import app, db
+from models import Job, DeadJob
+#----------------------------------------------------------------------------#
+# Background jobs.
+#----------------------------------------------------------------------------#
+
+# Work a write triggers but its response need not wait for (counter and
+# feed maintenance) is queued as a row of the job table, in the transaction
+# of the write, so a job exists exactly when its write committed.
+# `flask jobs work` claims due jobs in batches, runs each in a transaction
+# of its own and deletes it once that commits. On Postgres the claim skips
+# rows locked by other claims (FOR UPDATE SKIP LOCKED), so any number of
+# workers share the queue; on a SQLite file the claim is a single UPDATE,
+# which SQLite serializes. A failing job is retried after JOB_RETRY_DELAY
+# seconds, doubled for each further attempt, and after JOB_MAX_ATTEMPTS
+# moved to the dead_job table, where `flask jobs retry` requeues it. A job
+# whose worker died is claimed again once its lease runs out, so handlers
+# must be safe to run twice. Recurring jobs (counter roll-forward, feed
+# pruning) are queued by the workers themselves: each poll queues those
+# that have no row, and a finished one queues its next run.
+#
+#   flask jobs work             # keeps polling
+#   flask jobs work --burst     # until the queue is empty, e.g. from cron
+#   flask jobs status
+
+# jobs claimed by one worker at a time
+JOB_BATCH_SIZE = 10
+# seconds an idle worker waits before looking for jobs again
+JOB_POLL_SECONDS = 1.0
+
+# job name -> handler, called with the job's arguments
+JOB_HANDLERS = {}
+# job name -> seconds between runs, for jobs the workers keep queued
+RECURRING_JOBS = {}
+
+
+def job_handler(name):
+    def register(handler):
+        JOB_HANDLERS[name] = handler
+        return handler
+    return register
+
+
+def recurring_job(name, seconds):
+    # a handler without arguments run every `seconds` by the workers
+    def register(handler):
+        RECURRING_JOBS[name] = seconds
+        return job_handler(name)(handler)
+    return register
+
+
+def enqueue(db_session, name, **args):
+    # queue `name` in the current transaction of `db_session`; the
+    # arguments must be JSON serializable
+    if app.config.get('JOBS_INLINE'):
+        JOB_HANDLERS[name](**args)
+        return
+    db_session.execute(Job.__table__.insert().values(
+        name=name, args=json.dumps(args, sort_keys=True)))
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=app.config['JOB_RETRY_DELAY'] *
+                     2 ** (attempts - 1))
+
+
+#----------------------------------------------------------------------------#
+# Worker.
+#----------------------------------------------------------------------------#
+
+
+def worker_name():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def claim(worker, limit=JOB_BATCH_SIZE, now=None):
+    # reserve up to `limit` due jobs for `worker`, oldest first, counting
+    # the attempt; returns their rows
+    if now is None:
+        now = datetime.utcnow()
+    lease = now + timedelta(seconds=app.config['JOB_LEASE_SECONDS'])
+    available = db.and_(Job.run_at <= now, db.or_(
+        Job.locked_until.is_(None), Job.locked_until < now))
+    due = db.select([Job.id]).where(available).order_by(
+        Job.run_at, Job.id).limit(limit).with_for_update(skip_locked=True)
+
+    # the conditions are repeated for SQLite, which has no row locks
+    db.session.execute(Job.__table__.update().where(
+        Job.id.in_(due.scalar_subquery())).where(available).values(
+        locked_by=worker, locked_until=lease, attempts=Job.attempts + 1))
+    jobs = db.session.query(
+        Job.id, Job.name, Job.args, Job.attempts, Job.created_at
+    ).filter(
+        Job.locked_by == worker, Job.locked_until == lease
+    ).order_by(Job.run_at, Job.id).all()
+    db.session.commit()
+    return jobs
+
+
+def schedule_recurring(names=None, now=None):
+    # queue the recurring jobs (all if None) that have no row; a job that
+    # is in the dead_job table is queued afresh. Returns how many.
+    if now is None:
+        now = datetime.utcnow()
+    if names is None:
+        names = RECURRING_JOBS
+    queued = set(name for name, in db.session.query(Job.name).filter(
+        Job.name.in_(sorted(names))).distinct())
+    missing = [name for name in sorted(names) if name not in queued]
+    if missing:
+        db.session.execute(Job.__table__.insert(), [
+            {'name': name, 'args': '{}', 'run_at': now} for name in missing])
+    db.session.commit()
+    return len(missing)
+
+
+def run_job(job):
+    # True once the job's work committed; a failure is recorded for retry
+    try:
+        JOB_HANDLERS[job.name](**json.loads(job.args))
+        db.session.execute(Job.__table__.delete().where(Job.id == job.id))
+        if job.name in RECURRING_JOBS:
+            reschedule(job.name)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        app.logger.exception('job %d (%s) failed, attempt %d',
+                             job.id, job.name, job.attempts)
+        fail(job, repr(e))
+        return False
+
+
+def reschedule(name, now=None):
+    # the next run of a recurring job, unless one is already queued
+    if now is None:
+        now = datetime.utcnow()
+    if db.session.query(Job.id).filter(Job.name == name).first() is None:
+        db.session.execute(Job.__table__.insert().values(
+            name=name, args='{}',
+            run_at=now + timedelta(seconds=RECURRING_JOBS[name])))
+
+
+def fail(job, error, now=None):
+    # schedule the next attempt, or move the job to the dead letters
+    if now is None:
+        now = datetime.utcnow()
+    table = Job.__table__
+    if job.attempts >= app.config['JOB_MAX_ATTEMPTS']:
+        db.session.execute(DeadJob.__table__.insert().values(
+            id=job.id, name=job.name, args=job.args, attempts=job.attempts,
+            error=error, created_at=job.created_at, failed_at=now))
+        db.session.execute(table.delete().where(table.c.id == job.id))
+    else:
+        db.session.execute(table.update().where(table.c.id == job.id).values(
+            run_at=now + retry_delay(job.attempts), locked_by=None,
+            locked_until=None, last_error=error))
+    db.session.commit()
+
+
+def work(burst=False, poll=JOB_POLL_SECONDS, batch=JOB_BATCH_SIZE):
+    # run jobs until stopped (or, with `burst`, until none are due);
+    # returns (succeeded, failed)
+    worker = worker_name()
+    succeeded = failed = 0
+    while True:
+        schedule_recurring()
+        jobs = claim(worker, batch)
+        for job in jobs:
+            if run_job(job):
+                succeeded += 1
+            else:
+                failed += 1
+        if not jobs:
+            if burst:
+                return succeeded, failed
+            time.sleep(poll)
+
+
+def requeue(ids=None):
+    # move dead jobs (all if None) back to the queue; returns how many
+    dead = db.session.query(DeadJob)
+    if ids is not None:
+        dead = dead.filter(DeadJob.id.in_(ids))
+    rows = [{'id': job.id, 'name': job.name, 'args': job.args,
+             'created_at': job.created_at} for job in dead]
+    if rows:
+        db.session.execute(Job.__table__.insert(), rows)
+        db.session.execute(DeadJob.__table__.delete().where(
+            DeadJob.id.in_([row['id'] for row in rows])))
+    db.session.commit()
+    return len(rows)
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+jobs_cli = AppGroup('jobs', help='Run and inspect background jobs.')
+
+
+@jobs_cli.command('work')
+@click.option('--burst', is_flag=True,
+              help='exit once no jobs are due instead of polling')
+@click.option('--poll', type=float, default=JOB_POLL_SECONDS,
+              help='seconds between polls of an empty queue')
+@click.option('--batch', type=int, default=JOB_BATCH_SIZE,
+              help='jobs claimed at a time')
+def work_command(burst, poll, batch):
+    """Run queued jobs."""
+    succeeded, failed = work(burst, poll, batch)
+    click.echo('%d jobs done, %d failed' % (succeeded, failed))
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Count queued, running and dead jobs."""
+    now = datetime.utcnow()
+    running = db.and_(Job.locked_until.isnot(None), Job.locked_until >= now)
+    queued, due, claimed = db.session.query(
+        db.func.count(Job.id),
+        db.func.count(db.case((db.and_(Job.run_at <= now,
+                                       db.not_(running)), Job.id))),
+        db.func.count(db.case((running, Job.id)))).one()
+    dead = db.session.query(db.func.count(DeadJob.id)).scalar()
+    click.echo('%d queued (%d due, %d running), %d dead' % (
+        queued, due, claimed, dead))
+    for job in db.session.query(DeadJob).order_by(DeadJob.failed_at):
+        click.echo('dead %d %s %s after %d attempts: %s' % (
+            job.id, job.name, job.args, job.attempts, job.error))
+
+
+@jobs_cli.command('retry')
+@click.argument('ids', nargs=-1, type=int)
+def retry_command(ids):
+    """Requeue dead jobs (all of them without IDS)."""
+    click.echo('%d jobs requeued' % requeue(list(ids) or None))
@@ -0,0 +1,193 @@
+import threading
+import time
+from flask import g, request, has_app_context
+from flask import signals_available, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from engine import pool_status
+#----------------------------------------------------------------------------#
+# Request metrics.
+#----------------------------------------------------------------------------#
+
+# Every request records its wall time, the number and total time of its SQL
+# statements and the time spent rendering templates, aggregated per endpoint
+# and exposed at /metrics in the Prometheus text format. The numbers are per
+# worker process; Prometheus tells the workers apart by scrape target.
+# With SERVER_TIMING on, each response also carries its own numbers in a
+# Server-Timing header for the browser's network panel.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class EndpointStats(object):
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.responses = {}
+
+
+class RequestMetrics(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, status, seconds, queries, query_seconds,
+               template_seconds):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.seconds += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+            stats.queries += queries
+            stats.query_seconds += query_seconds
+            stats.template_seconds += template_seconds
+            stats.responses[status] = stats.responses.get(status, 0) + 1
+
+
+request_metrics = RequestMetrics()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement(conn, cursor, statement, parameters, context,
+                    executemany):
+    conn.info.setdefault('statement_start', []).append(time.perf_counter())
+    if has_app_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['statement_start'].pop()
+    if has_app_context():
+        g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def drop_failed_statement(exception_context):
+    # after_cursor_execute never fires for a statement that raised
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('statement_start'):
+        connection.info['statement_start'].pop()
+
+
+def start_template(sender, template, context, **extra):
+    g.setdefault('template_start', []).append(time.perf_counter())
+
+
+def end_template(sender, template, context, **extra):
+    if g.get('template_start'):
+        g.template_seconds = g.get('template_seconds', 0.0) + (
+            time.perf_counter() - g.template_start.pop())
+
+
+def server_timing(seconds):
+    return ', '.join([
+        'db;dur=%.3f;desc="%d queries"' % (
+            1000 * g.get('sql_seconds', 0.0), g.get('sql_count', 0)),
+        'tpl;dur=%.3f' % (1000 * g.get('template_seconds', 0.0)),
+        'total;dur=%.3f' % (1000 * seconds),
+    ])
+
+
+def init_metrics(app):
+    # template timing needs Flask's signals, i.e. blinker
+    if signals_available:
+        before_render_template.connect(start_template, app)
+        template_rendered.connect(end_template, app)
+
+    @app.before_request
+    def start_request():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if 'request_start' not in g:
+            return response
+        seconds = time.perf_counter() - g.request_start
+        request_metrics.record(
+            request.endpoint or 'unmatched', response.status_code, seconds,
+            g.get('sql_count', 0), g.get('sql_seconds', 0.0),
+            g.get('template_seconds', 0.0))
+        if app.config.get('SERVER_TIMING'):
+            response.headers['Server-Timing'] = server_timing(seconds)
+        return response
+
+
+#----------------------------------------------------------------------------#
+# Prometheus text format.
+#----------------------------------------------------------------------------#
+
+
+def metric(lines, name, kind, help, samples):
+    lines.append('# HELP fyyur_%s %s' % (name, help))
+    lines.append('# TYPE fyyur_%s %s' % (name, kind))
+    for suffix, labels, value in samples:
+        label_text = ','.join('%s="%s"' % (key, str(labels[key]).replace(
+            '\\', '\\\\').replace('"', '\\"')) for key in sorted(labels))
+        lines.append('fyyur_%s%s%s %r' % (
+            name, suffix, '{%s}' % label_text if label_text else '',
+            value))
+
+
+def render_metrics(db):
+    with request_metrics.lock:
+        endpoints = sorted(request_metrics.endpoints.items())
+        lines = []
+
+        samples = []
+        for endpoint, stats in endpoints:
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                samples.append(('_bucket', {'endpoint': endpoint,
+                                            'le': bound}, count))
+            samples.append(('_bucket', {'endpoint': endpoint, 'le': '+Inf'},
+                            stats.requests))
+            samples.append(('_sum', {'endpoint': endpoint}, stats.seconds))
+            samples.append(('_count', {'endpoint': endpoint},
+                            stats.requests))
+        metric(lines, 'request_duration_seconds', 'histogram',
+               'Wall time per request.', samples)
+
+        metric(lines, 'responses_total', 'counter',
+               'Responses by endpoint and status.',
+               [('', {'endpoint': endpoint, 'status': status}, count)
+                for endpoint, stats in endpoints
+                for status, count in sorted(stats.responses.items())])
+        metric(lines, 'db_queries_total', 'counter',
+               'SQL statements executed.',
+               [('', {'endpoint': endpoint}, stats.queries)
+                for endpoint, stats in endpoints])
+        metric(lines, 'db_seconds_total', 'counter',
+               'Time spent executing SQL statements.',
+               [('', {'endpoint': endpoint}, stats.query_seconds)
+                for endpoint, stats in endpoints])
+        metric(lines, 'template_seconds_total', 'counter',
+               'Time spent rendering templates.',
+               [('', {'endpoint': endpoint}, stats.template_seconds)
+                for endpoint, stats in endpoints])
+
+    pool = pool_status(db)
+    for name, kind, help in (
+            ('checkouts', 'counter', 'Connections checked out of the pool.'),
+            ('timeouts', 'counter', 'Checkouts that timed out.'),
+            ('wait_seconds', 'counter', 'Time spent waiting for checkouts.'),
+            ('max_wait_seconds', 'gauge', 'Longest checkout wait.'),
+            ('connects', 'counter', 'Database connections opened.'),
+            ('invalidations', 'counter', 'Connections invalidated.'),
+            ('size', 'gauge', 'Configured pool size.'),
+            ('checked_in', 'gauge', 'Idle connections in the pool.'),
+            ('checked_out', 'gauge', 'Connections in use.'),
+            ('overflow', 'gauge', 'Connections beyond the pool size.')):
+        if name in pool:
+            metric(lines, 'db_pool_' + name, kind, help,
+                   [('', {'pool': pool['pool']}, pool[name])])
+    return '\n'.join(lines) + '\n'
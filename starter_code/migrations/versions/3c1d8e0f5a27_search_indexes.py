@@ -0,0 +1,58 @@
+"""trigram search indexes
+
+Revision ID: 3c1d8e0f5a27
+Revises: afb65a20326c
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1d8e0f5a27'
+down_revision = 'afb65a20326c'
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs matched by the search pages with ILIKE '%term%'
+TRIGRAM_COLUMNS = [
+    ('venue', 'name'),
+    ('venue', 'city'),
+    ('venue', 'state'),
+    ('artist', 'name'),
+    ('artist', 'city'),
+    ('artist', 'state'),
+    ('artist', 'genres'),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # array_to_string() is only STABLE, so wrap it to index venue genres
+    op.execute(
+        'CREATE OR REPLACE FUNCTION fyyur_genres_text(varchar[]) '
+        'RETURNS text LANGUAGE sql IMMUTABLE '
+        "AS $$ SELECT array_to_string($1, ' ') $$"
+    )
+
+    for table, column in TRIGRAM_COLUMNS:
+        op.create_index(
+            'ix_{}_{}_trgm'.format(table, column), table, [column],
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'})
+
+    op.create_index(
+        'ix_venue_genres_trgm', 'venue',
+        [sa.text('fyyur_genres_text(genres) gin_trgm_ops')],
+        postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_venue_genres_trgm', table_name='venue')
+
+    for table, column in TRIGRAM_COLUMNS:
+        op.drop_index('ix_{}_{}_trgm'.format(table, column), table_name=table)
+
+    op.execute('DROP FUNCTION IF EXISTS fyyur_genres_text(varchar[])')
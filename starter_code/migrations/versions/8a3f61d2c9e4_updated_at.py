@@ -0,0 +1,29 @@
+"""updated_at versions for venue, artist and show
+
+Revision ID: 8a3f61d2c9e4
+Revises: 5e92a7c4d1b3
+Create Date: 2026-10-18 13:21:08.402716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a3f61d2c9e4'
+down_revision = '5e92a7c4d1b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows start out as modified "now" (UTC, like the models)
+    for table in ('venue', 'artist', 'show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(
+            "UPDATE {} SET updated_at = now() at time zone 'utc'".format(table))
+
+
+def downgrade():
+    for table in ('show', 'artist', 'venue'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,30 @@
+"""page_version rows for conditional requests
+
+Revision ID: a6c1e9f40b73
+Revises: f3a9d6b1c852
+Create Date: 2026-10-19 10:12:05.481226
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c1e9f40b73'
+down_revision = 'f3a9d6b1c852'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'page_version',
+        sa.Column('tag', sa.String(length=100), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('tag')
+    )
+
+
+def downgrade():
+    op.drop_table('page_version')
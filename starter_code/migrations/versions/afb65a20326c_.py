@@ -1,7 +1,7 @@
 """empty message
 
 Revision ID: afb65a20326c
-Revises: 
+Revises: 0b7f2c9d4e61
 Create Date: 2021-06-23 01:38:49.640217
 
 """
@@ -11,7 +11,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = 'afb65a20326c'
-down_revision = None
+down_revision = '0b7f2c9d4e61'
 branch_labels = None
 depends_on = None
 
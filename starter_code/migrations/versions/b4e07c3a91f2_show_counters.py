@@ -0,0 +1,49 @@
+"""upcoming/past show counters and next show time on venue and artist
+
+Revision ID: b4e07c3a91f2
+Revises: 8a3f61d2c9e4
+Create Date: 2026-10-18 18:02:44.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e07c3a91f2'
+down_revision = '8a3f61d2c9e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, owner in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        op.add_column(table, sa.Column(
+            'upcoming_shows_count', sa.Integer(), nullable=False,
+            server_default='0'))
+        op.add_column(table, sa.Column(
+            'past_shows_count', sa.Integer(), nullable=False,
+            server_default='0'))
+        op.add_column(table, sa.Column(
+            'next_show_at', sa.DateTime(), nullable=True))
+        op.create_index(op.f('ix_{}_next_show_at'.format(table)), table,
+                        ['next_show_at'], unique=False)
+        # backfill from the shows, as of now (start_time is local time)
+        op.execute(
+            "UPDATE {table} SET "
+            "upcoming_shows_count = (SELECT count(*) FROM show WHERE "
+            "show.{owner} = {table}.id AND show.start_time > localtimestamp), "
+            "past_shows_count = (SELECT count(*) FROM show WHERE "
+            "show.{owner} = {table}.id AND show.start_time < localtimestamp), "
+            "next_show_at = (SELECT min(start_time) FROM show WHERE "
+            "show.{owner} = {table}.id AND show.start_time > localtimestamp)"
+            .format(table=table, owner=owner))
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index(op.f('ix_{}_next_show_at'.format(table)),
+                      table_name=table)
+        op.drop_column(table, 'next_show_at')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,56 @@
+"""upcoming_show feed table
+
+Revision ID: d27a5f8e6c10
+Revises: b4e07c3a91f2
+Create Date: 2026-10-18 19:41:09.527310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd27a5f8e6c10'
+down_revision = 'b4e07c3a91f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'upcoming_show',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('venue_name', sa.String(), nullable=True),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('artist_name', sa.String(), nullable=True),
+        sa.Column('artist_image_link', sa.String(length=500), nullable=True),
+        sa.ForeignKeyConstraint(['id'], ['show.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_upcoming_show_start_time_id', 'upcoming_show',
+                    ['start_time', 'id'], unique=False)
+    op.create_index(op.f('ix_upcoming_show_venue_id'), 'upcoming_show',
+                    ['venue_id'], unique=False)
+    op.create_index(op.f('ix_upcoming_show_artist_id'), 'upcoming_show',
+                    ['artist_id'], unique=False)
+    # backfill from the shows, as of now (start_time is local time)
+    op.execute(
+        "INSERT INTO upcoming_show (id, start_time, venue_id, venue_name, "
+        "artist_id, artist_name, artist_image_link) "
+        "SELECT show.id, show.start_time, show.venue_id, venue.name, "
+        "show.artist_id, artist.name, artist.image_link FROM show "
+        "JOIN venue ON venue.id = show.venue_id "
+        "JOIN artist ON artist.id = show.artist_id "
+        "WHERE show.start_time > localtimestamp")
+
+
+def downgrade():
+    op.drop_index(op.f('ix_upcoming_show_artist_id'),
+                  table_name='upcoming_show')
+    op.drop_index(op.f('ix_upcoming_show_venue_id'),
+                  table_name='upcoming_show')
+    op.drop_index('ix_upcoming_show_start_time_id',
+                  table_name='upcoming_show')
+    op.drop_table('upcoming_show')
@@ -0,0 +1,130 @@
+"""genre lookup table replacing venue.genres and artist.genres
+
+Revision ID: e5c8b0a3d714
+Revises: d27a5f8e6c10
+Create Date: 2026-10-18 21:15:32.804117
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c8b0a3d714'
+down_revision = 'd27a5f8e6c10'
+branch_labels = None
+depends_on = None
+
+# the choices of the genres fields in forms.py
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+    'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul',
+    'Other',
+]
+
+genre = sa.table('genre', sa.column('id', sa.Integer),
+                 sa.column('name', sa.String))
+
+
+def parse_genres(value):
+    # venue.genres is an array; artist.genres holds whatever a list became
+    # as text: "{Jazz,\"Rock n Roll\"}", "['Jazz', 'Folk']" or "Jazz,Folk"
+    if value is None:
+        return []
+    if not isinstance(value, str):
+        return [name for name in value if name]
+    value = value.strip().strip('{}[]')
+    return [name for name in (
+        re.sub(r'^[\s"\']+|[\s"\']+$', '', part) for part in value.split(','))
+        if name]
+
+
+def upgrade():
+    op.create_table(
+        'genre',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    for owner in ('venue', 'artist'):
+        op.create_table(
+            '{}_genre'.format(owner),
+            sa.Column('{}_id'.format(owner), sa.Integer(), nullable=False),
+            sa.Column('genre_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['{}_id'.format(owner)],
+                                    ['{}.id'.format(owner)],
+                                    ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['genre_id'], ['genre.id']),
+            sa.PrimaryKeyConstraint('{}_id'.format(owner), 'genre_id')
+        )
+        op.create_index(
+            'ix_{0}_genre_genre_id_{0}_id'.format(owner),
+            '{}_genre'.format(owner), ['genre_id', '{}_id'.format(owner)],
+            unique=False)
+
+    # parse the existing values into links
+    bind = op.get_bind()
+    links = {}
+    for owner in ('venue', 'artist'):
+        links[owner] = [
+            (owner_id, name)
+            for owner_id, value in bind.execute(sa.text(
+                'SELECT id, genres FROM {}'.format(owner)))
+            for name in set(parse_genres(value))]
+    names = set(GENRES)
+    for owner_links in links.values():
+        names.update(name for owner_id, name in owner_links)
+    op.bulk_insert(genre, [{'name': name} for name in sorted(names)])
+    ids = dict(bind.execute(sa.select([genre.c.name, genre.c.id])))
+    for owner, owner_links in links.items():
+        if owner_links:
+            op.bulk_insert(sa.table(
+                '{}_genre'.format(owner), sa.column('{}_id'.format(owner)),
+                sa.column('genre_id')), [
+                    {'{}_id'.format(owner): owner_id, 'genre_id': ids[name]}
+                    for owner_id, name in owner_links])
+
+    # the old columns and their search indexes
+    op.drop_index('ix_venue_genres_trgm', table_name='venue')
+    op.drop_index('ix_artist_genres_trgm', table_name='artist')
+    op.drop_column('venue', 'genres')
+    op.drop_column('artist', 'genres')
+    op.execute('DROP FUNCTION IF EXISTS fyyur_genres_text(varchar[])')
+
+
+def downgrade():
+    op.add_column('venue', sa.Column(
+        'genres', postgresql.ARRAY(sa.String()), nullable=True))
+    op.add_column('artist', sa.Column(
+        'genres', sa.String(length=120), nullable=True))
+    op.execute(
+        'UPDATE venue SET genres = (SELECT array_agg(genre.name ORDER BY '
+        'genre.name) FROM venue_genre JOIN genre ON genre.id = '
+        'venue_genre.genre_id WHERE venue_genre.venue_id = venue.id)')
+    op.execute(
+        "UPDATE artist SET genres = (SELECT string_agg(genre.name, ',' "
+        "ORDER BY genre.name) FROM artist_genre JOIN genre ON genre.id = "
+        "artist_genre.genre_id WHERE artist_genre.artist_id = artist.id)")
+
+    op.execute(
+        'CREATE OR REPLACE FUNCTION fyyur_genres_text(varchar[]) '
+        'RETURNS text LANGUAGE sql IMMUTABLE '
+        "AS $$ SELECT array_to_string($1, ' ') $$"
+    )
+    op.create_index(
+        'ix_venue_genres_trgm', 'venue',
+        [sa.text('fyyur_genres_text(genres) gin_trgm_ops')],
+        postgresql_using='gin')
+    op.create_index(
+        'ix_artist_genres_trgm', 'artist', ['genres'],
+        postgresql_using='gin', postgresql_ops={'genres': 'gin_trgm_ops'})
+
+    for owner in ('artist', 'venue'):
+        op.drop_index('ix_{0}_genre_genre_id_{0}_id'.format(owner),
+                      table_name='{}_genre'.format(owner))
+        op.drop_table('{}_genre'.format(owner))
+    op.drop_table('genre')
@@ -1,11 +1,51 @@
+from datetime import datetime
+from sqlalchemy.ext.associationproxy import association_proxy
 from app import db
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
 
+class Genre(db.Model):
+    __tablename__ = 'genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+
+def genre_named(name):
+    # the Genre called `name`, created if new; used when assigning names to
+    # Venue.genres / Artist.genres
+    with db.session.no_autoflush:
+        genre = Genre.query.filter_by(name=name).first()
+    return genre if genre is not None else Genre(name=name)
+
+
+# (owner, genre) links; the (genre_id, owner) index serves genre filters
+venue_genre = db.Table(
+    'venue_genre',
+    db.Column('venue_id', db.Integer,
+              db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'),
+              primary_key=True),
+    db.Index('ix_venue_genre_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+artist_genre = db.Table(
+    'artist_genre',
+    db.Column('artist_id', db.Integer,
+              db.ForeignKey('artist.id', ondelete='CASCADE'),
+              primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'),
+              primary_key=True),
+    db.Index('ix_artist_genre_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+        db.Index('ix_venue_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -16,11 +56,22 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(500))
-    genres = db.Column(db.ARRAY(db.String()))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+    # show counters, maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
     artists = db.relationship(
-        "Artist", secondary="show", lazy="joined", cascade='all, delete')
+        "Artist", secondary="show", lazy="select", cascade='all, delete')
+    genre_items = db.relationship(Genre, secondary=venue_genre,
+                                  order_by=Genre.name)
+    # genre names, e.g. venue.genres = ['Jazz', 'Folk']
+    genres = association_proxy('genre_items', 'name', creator=genre_named)
 
 
 class Artist(db.Model):
@@ -31,23 +82,107 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120), unique=True)
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+    # show counters, maintained by counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
+    next_show_at = db.Column(db.DateTime, index=True)
     venue = db.relationship("Venue", secondary="show",
-                            lazy="joined", cascade='all, delete')
+                            lazy="select", cascade='all, delete')
+    genre_items = db.relationship(Genre, secondary=artist_genre,
+                                  order_by=Genre.name)
+    # genre names, e.g. artist.genres = ['Jazz', 'Folk']
+    genres = association_proxy('genre_items', 'name', creator=genre_named)
 
 
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time', 'start_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey(
         'artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
     start_time = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
     venue = db.relationship(Venue, backref=db.backref("shows", lazy=True))
     artist = db.relationship(Artist, backref=db.backref("shows", lazy=True))
+
+
+class UpcomingShow(db.Model):
+    # the /shows feed: one row per upcoming show with the venue and artist
+    # fields it renders, maintained by feed.py
+    __tablename__ = 'upcoming_show'
+    __table_args__ = (
+        db.Index('ix_upcoming_show_start_time_id', 'start_time', 'id'),
+    )
+
+    id = db.Column(db.Integer, db.ForeignKey('show.id', ondelete='CASCADE'),
+                   primary_key=True, autoincrement=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    venue_id = db.Column(db.Integer, nullable=False, index=True)
+    venue_name = db.Column(db.String)
+    artist_id = db.Column(db.Integer, nullable=False, index=True)
+    artist_name = db.Column(db.String)
+    artist_image_link = db.Column(db.String(500))
+
+
+class PageVersion(db.Model):
+    # bumped by every commit that changes what the pages under `tag` render
+    # ('venues', 'artists', 'venue:<id>', 'artist:<id>'), see cache.py
+    __tablename__ = 'page_version'
+
+    tag = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    changed_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+
+
+class Job(db.Model):
+    # a queued side effect of a write, run by `flask jobs work` (jobs.py)
+    __tablename__ = 'job'
+    __table_args__ = (
+        db.Index('ix_job_run_at_id', 'run_at', 'id'),
+        # ids are never reused, so a dead job keeps its id when moved
+        {'sqlite_autoincrement': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    # keyword arguments of the handler, as JSON
+    args = db.Column(db.Text, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_by = db.Column(db.String(255))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+
+
+class DeadJob(db.Model):
+    # a job that failed JOB_MAX_ATTEMPTS times, kept until requeued with
+    # `flask jobs retry` or deleted
+    __tablename__ = 'dead_job'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    args = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False)
+    failed_at = db.Column(db.DateTime, nullable=False,
+                          default=datetime.utcnow)
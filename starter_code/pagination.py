@@ -0,0 +1,121 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from collections import namedtuple
+from datetime import datetime
+from flask import request, abort
+from app import db
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+PER_PAGE = 20
+
+# items of one page plus the opaque cursors of its neighbours (None at ends)
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+def encode_cursor(values):
+    values = [{'dt': value.isoformat()} if isinstance(value, datetime)
+              else value for value in values]
+    return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    # ValueError for anything that did not come from encode_cursor()
+    values = json.loads(urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list):
+        raise ValueError('malformed cursor')
+    return [datetime.fromisoformat(value['dt']) if isinstance(value, dict)
+            else value for value in values]
+
+
+def cursor_value(value, column):
+    # a decoded cursor value as its key column's type; ValueError when it
+    # cannot be one (a tampered cursor, or one of another page's key)
+    if value is None and column.nullable:
+        return value
+    python_type = column.type.python_type
+    if python_type is datetime and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    # bool is an int subclass, but never a key value
+    if isinstance(value, bool) or not isinstance(value, python_type):
+        raise ValueError('cursor value does not match the page key')
+    return value
+
+
+def row_key(row, columns):
+    return [getattr(row, column.key) for column in columns]
+
+
+def keyset_query(query, columns, after=None, before=None,
+                 descending=False, per_page=PER_PAGE):
+    # `query` narrowed and ordered for one page (plus one row to tell if
+    # there is more); see keyset_page()
+    forward = before is None
+    cursor = after if forward else before
+    ascending = forward != descending
+
+    if cursor is not None:
+        if len(cursor) != len(columns):
+            raise ValueError('cursor does not match the page key')
+        cursor = [cursor_value(value, column)
+                  for value, column in zip(cursor, columns)]
+        key = db.tuple_(*columns)
+        bound = db.tuple_(*[db.literal(value, column.type)
+                            for value, column in zip(cursor, columns)])
+        query = query.filter(key > bound if ascending else key < bound)
+
+    return query.order_by(None).order_by(
+        *[column.asc() if ascending else column.desc() for column in columns]
+    ).limit(per_page + 1)
+
+
+def keyset_result(rows, columns, after=None, before=None,
+                  per_page=PER_PAGE):
+    # the Page for the rows fetched by keyset_query()
+    forward = before is None
+    cursor = after if forward else before
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+    if not rows:
+        return Page(rows, None, None)
+
+    first = encode_cursor(row_key(rows[0], columns))
+    last = encode_cursor(row_key(rows[-1], columns))
+    if forward:
+        return Page(rows, last if more else None,
+                    first if cursor is not None else None)
+    return Page(rows, last, first if more else None)
+
+
+def keyset_page(query, columns, after=None, before=None,
+                descending=False, per_page=PER_PAGE):
+    # One page of `query` ordered by the `columns` key (e.g. (Show.id,) or
+    # (Show.start_time, Show.id)), starting right after the `after` key or
+    # ending right before the `before` key. The key must be unique and every
+    # column must be selected by the query so rows can produce cursors.
+    rows = keyset_query(query, columns, after, before, descending,
+                        per_page).all()
+    return keyset_result(rows, columns, after, before, per_page)
+
+
+def page_cursors():
+    # (after, before) keys from the request's ?after= / ?before= cursors
+    try:
+        return tuple(decode_cursor(request.values[name])
+                     if request.values.get(name) else None
+                     for name in ('after', 'before'))
+    except (ValueError, TypeError, KeyError):
+        abort(400)
+
+
+def paginate(query, columns, descending=False, per_page=PER_PAGE):
+    after, before = page_cursors()
+    try:
+        return keyset_page(query, columns, after, before,
+                           descending, per_page)
+    except ValueError:
+        abort(400)
@@ -0,0 +1,200 @@
+from itertools import groupby
+from datetime import datetime
+from app import db
+from models import Venue, Artist, Show, UpcomingShow, PageVersion
+from pagination import keyset_page
+from genres import genre_filter
+from cache import entity_tag
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+# Loader options per kind of page. Relationships default to plain lazy
+# loading; list and detail pages never touch them (their shows come from
+# the queries below), so any access there raises instead of silently
+# issuing another statement. Detail pages load the genres up front.
+LOAD_PROFILES = {
+    'list': lambda model: [db.load_only(model.id, model.name),
+                           db.raiseload('*')],
+    'detail': lambda model: [db.selectinload(model.genre_items),
+                             db.raiseload('*')],
+    'edit': lambda model: [db.lazyload('*')],
+}
+
+
+def load_profile(model, profile):
+    return model.query.options(*LOAD_PROFILES[profile](model))
+
+
+# page keys of the listings below
+VENUE_AREA_KEY = (Venue.state, Venue.city, Venue.id)
+FEED_KEY = (UpcomingShow.start_time, UpcomingShow.id)
+SHOW_KEY = (Show.start_time, Show.id)
+
+
+def venue_area_query(genres=None, state=None):
+    # the /venues listing rows (the upcoming counts are the venues' own
+    # counter columns), optionally only venues of the given genres and state
+    query = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    )
+    if genres:
+        query = query.filter(genre_filter(Venue, genres))
+    if state:
+        query = query.filter(Venue.state == state)
+    return query
+
+
+def venue_areas(after=None, before=None, genres=None, state=None):
+    # One statement for a page of the /venues listing, then a single pass
+    # over the ordered rows to bucket them by (city, state).
+    return group_areas(keyset_page(venue_area_query(genres, state),
+                                   VENUE_AREA_KEY, after, before))
+
+
+def group_areas(page):
+    areas = []
+    for (city, state), venues in groupby(page.items,
+                                         lambda row: (row.city, row.state)):
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': [{
+                'id': venue.id,
+                'name': venue.name,
+                'num_upcoming_shows': venue.num_upcoming_shows
+            } for venue in venues]
+        })
+
+    return page._replace(items=areas)
+
+
+def upcoming_show_feed(now=None, after=None, before=None):
+    # A page of the /shows feed, soonest first.
+    return keyset_page(upcoming_feed_query(now), FEED_KEY, after, before)
+
+
+def upcoming_feed_query(now=None):
+    # Read from the precomputed upcoming_show table (see feed.py): one range
+    # scan of its index, no join. Rows of shows that started since the last
+    # prune are skipped.
+    if now is None:
+        now = datetime.now()
+
+    return db.session.query(
+        UpcomingShow.id,
+        UpcomingShow.start_time,
+        UpcomingShow.venue_id,
+        UpcomingShow.venue_name,
+        UpcomingShow.artist_id,
+        UpcomingShow.artist_name,
+        UpcomingShow.artist_image_link
+    ).filter(
+        UpcomingShow.start_time > now
+    )
+
+
+#----------------------------------------------------------------------------#
+# Past & upcoming shows.
+#----------------------------------------------------------------------------#
+
+# number of past / upcoming shows rendered on a detail page and per page of
+# the *_show_history endpoints.
+SHOWS_PER_PAGE = 12
+
+# owner kind -> (owner column, other side of the show, its id column, prefix)
+SHOW_OWNERS = {
+    'venue': (Show.venue_id, Artist, Show.artist_id, 'artist'),
+    'artist': (Show.artist_id, Venue, Show.venue_id, 'venue'),
+}
+
+
+def show_slice(kind, owner_id, when, now=None,
+               limit=SHOWS_PER_PAGE, after=None, before=None):
+    # A page of past shows newest first or upcoming shows soonest first,
+    # keyed by (start_time, id).
+    return keyset_page(show_slice_query(kind, owner_id, when, now), SHOW_KEY,
+                       after, before, descending=when == 'past',
+                       per_page=limit)
+
+
+def show_slice_query(kind, owner_id, when, now=None):
+    if now is None:
+        now = datetime.now()
+    owner_column, other, other_column, prefix = SHOW_OWNERS[kind]
+
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        other_column.label(prefix + '_id'),
+        other.name.label(prefix + '_name'),
+        other.image_link.label(prefix + '_image_link')
+    ).join(
+        other, other.id == other_column
+    ).filter(owner_column == owner_id)
+
+    if when == 'past':
+        return query.filter(Show.start_time < now)
+    return query.filter(Show.start_time > now)
+
+
+def show_history(kind, owner, now=None, limit=SHOWS_PER_PAGE):
+    # The past/upcoming part of a venue or artist detail page; the totals
+    # are the owner's counter columns.
+    if now is None:
+        now = datetime.now()
+    past = show_slice(kind, owner.id, 'past', now, limit)
+    upcoming = show_slice(kind, owner.id, 'upcoming', now, limit)
+    return history_data(owner, past, upcoming)
+
+
+def history_data(owner, past, upcoming):
+    return {
+        "past_shows": past.items,
+        "upcoming_shows": upcoming.items,
+        "past_shows_count": owner.past_shows_count,
+        "upcoming_shows_count": owner.upcoming_shows_count,
+        "past_shows_cursor": past.next_cursor,
+        "upcoming_shows_cursor": upcoming.next_cursor,
+    }
+
+
+#----------------------------------------------------------------------------#
+# Page versions.
+#----------------------------------------------------------------------------#
+
+
+def page_version(tag):
+    # (version, changed_at) of the pages under `tag`, see cache.py
+    return db.session.query(
+        PageVersion.version, PageVersion.changed_at
+    ).filter(PageVersion.tag == tag)
+
+
+def detail_version(kind, owner_id):
+    # Everything a venue or artist detail page depends on, as one row of the
+    # owner (None for an unknown id): its own updated_at, show counters and
+    # next show (the past/upcoming split moves when it starts), plus the
+    # version of its pages, which every commit changing its shows or the
+    # venues/artists they list bumps.
+    model = Venue if kind == 'venue' else Artist
+    version = page_version(entity_tag(kind, owner_id))
+
+    return db.session.query(
+        model.updated_at,
+        model.upcoming_shows_count,
+        model.past_shows_count,
+        model.next_show_at,
+        version.with_entities(PageVersion.version).scalar_subquery(),
+        version.with_entities(PageVersion.changed_at).scalar_subquery()
+    ).filter(model.id == owner_id).first()
+
+
+def listing_version(tag):
+    # The same for the /venues or /artists listing: the version of the
+    # 'venues' or 'artists' pages, (None, None) until a commit bumps it.
+    return page_version(tag).first() or (None, None)
@@ -0,0 +1,59 @@
+import random
+import time
+from flask import (
+    current_app, g, request, session, has_app_context, has_request_context
+)
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+from engine import engine_options
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# Views marked with @read_replica run their queries against one of the
+# SQLALCHEMY_REPLICA_URIS; everything else, and any flush, uses the primary.
+# After a user commits a write, their requests stay on the primary for
+# REPLICA_STICKY_SECONDS so they see their own writes despite replica lag.
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replica = g.get('db_replica') if has_app_context() else None
+        if replica is not None and not self._flushing:
+            return replica
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+def stick_to_primary(db_session):
+    if has_request_context():
+        session['db_primary_until'] = time.time() + current_app.config.get(
+            'REPLICA_STICKY_SECONDS', 5)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+        # on the factory: sessionmaker subclasses RoutingSession, and the
+        # subclass does not pick up listeners of its base class
+        event.listen(factory, 'after_commit', stick_to_primary)
+        return factory
+
+
+def read_replica(view):
+    view.read_replica = True
+    return view
+
+
+def init_routing(app):
+    replicas = [create_engine(uri, **engine_options(app.config, uri))
+                for uri in app.config.get('SQLALCHEMY_REPLICA_URIS') or []]
+    app.extensions['replicas'] = replicas
+
+    @app.before_request
+    def choose_database():
+        view = app.view_functions.get(request.endpoint)
+        if (replicas and getattr(view, 'read_replica', False) and
+                time.time() >= session.get('db_primary_until', 0)):
+            g.db_replica = random.choice(replicas)
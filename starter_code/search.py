@@ -0,0 +1,90 @@
+from app import app, db
+from pagination import keyset_page
+from genres import genre_filter, genre_match
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+SEARCH_PER_PAGE = 20
+
+
+def like_pattern(term):
+    # '%term%' with the term's own LIKE wildcards escaped
+    term = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%' + term + '%'
+
+
+class LikeSearch(object):
+    # Portable backend (SQLite in tests): ILIKE on every searchable column
+    # and on the genre names, ranked exact name > name prefix > name
+    # substring > other columns.
+
+    def columns(self, model):
+        return [model.name, model.city, model.state]
+
+    def match(self, model, term):
+        pattern = like_pattern(term)
+        return db.or_(*[column.ilike(pattern, escape='\\')
+                        for column in self.columns(model)] +
+                      [genre_match(model, pattern)])
+
+    def rank(self, model, term):
+        prefix = like_pattern(term)[1:]
+        return db.case(
+            (db.func.lower(model.name) == term.lower(), 3),
+            (model.name.ilike(prefix, escape='\\'), 2),
+            (model.name.ilike(like_pattern(term), escape='\\'), 1),
+            else_=0)
+
+
+class TrigramSearch(LikeSearch):
+    # Postgres backend: the same ILIKE predicates are served by the pg_trgm
+    # GIN indexes from migration 3c1d8e0f5a27, ranked by trigram similarity;
+    # a genre hit counts as a full match of a secondary column.
+
+    def rank(self, model, term):
+        name, city, state = self.columns(model)
+        return db.func.similarity(name, term) + 0.5 * db.func.greatest(
+            db.func.similarity(city, term),
+            db.func.similarity(state, term),
+            db.case((genre_match(model, like_pattern(term)), 1.0),
+                    else_=0.0))
+
+
+SEARCH_BACKENDS = {
+    'like': LikeSearch,
+    'trigram': TrigramSearch,
+}
+
+
+def search_backend():
+    name = app.config.get('SEARCH_BACKEND')
+    if name is None:
+        if db.engine.dialect.name == 'postgresql':
+            name = 'trigram'
+        else:
+            name = 'like'
+    return SEARCH_BACKENDS[name]()
+
+
+def search(model, term, after=None, before=None, per_page=SEARCH_PER_PAGE,
+           genres=None):
+    # (total hits, one keyset Page of (id, name, num_upcoming_shows, rank)
+    # rows, most relevant first), optionally only venues/artists of the
+    # given genres; ValueError for a cursor that does not fit the page key.
+    backend = search_backend()
+    match = backend.match(model, term)
+    if genres:
+        match = db.and_(match, genre_filter(model, genres))
+    rank = backend.rank(model, term).label('rank')
+
+    total = db.session.query(db.func.count(model.id)).filter(match).scalar()
+    page = keyset_page(db.session.query(
+        model.id,
+        model.name,
+        model.upcoming_shows_count.label('num_upcoming_shows'),
+        rank
+    ).filter(match), (rank, model.id), after, before,
+        descending=True, per_page=per_page)
+
+    return total, page
@@ -0,0 +1,183 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+
+# Fills Genre, Venue, Artist and Show with generated rows. The same scale
+# and seed always produce the same rows: show times are spread a year
+# either side of SEED_DAY, a fixed day, not the current one, so the data
+# (and what bench.py measures on it) does not change with the date.
+#
+#   python seed.py --scale 100k
+
+SCALES = {
+    '1k': 1000,
+    '100k': 100000,
+    '1m': 1000000,
+}
+SHOWS_PER_VENUE = 20
+SHOWS_PER_ARTIST = 10
+BATCH_SIZE = 5000
+# the middle of the generated show times
+SEED_DAY = datetime(2027, 1, 1)
+
+CITIES = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('San Diego', 'CA'),
+    ('New York', 'NY'), ('Brooklyn', 'NY'), ('Buffalo', 'NY'),
+    ('Austin', 'TX'), ('Houston', 'TX'), ('Dallas', 'TX'),
+    ('Seattle', 'WA'), ('Portland', 'OR'), ('Denver', 'CO'),
+    ('Chicago', 'IL'), ('Nashville', 'TN'), ('Memphis', 'TN'),
+    ('New Orleans', 'LA'), ('Atlanta', 'GA'), ('Miami', 'FL'),
+    ('Boston', 'MA'), ('Philadelphia', 'PA'), ('Detroit', 'MI'),
+    ('Minneapolis', 'MN'), ('Phoenix', 'AZ'), ('Las Vegas', 'NV'),
+]
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+    'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+    'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul',
+]
+WORDS = [
+    'Blue', 'Velvet', 'Electric', 'Golden', 'Midnight', 'Copper', 'Silver',
+    'Hollow', 'Wild', 'Quiet', 'Neon', 'Rusty', 'Lucky', 'Crimson', 'Echo',
+    'Harbor', 'Lantern', 'Owl', 'River', 'Comet', 'Fox', 'Garden', 'Cellar',
+]
+
+
+def name(rng, index, suffix):
+    return '%s %s %s %d' % (rng.choice(WORDS), rng.choice(WORDS), suffix,
+                            index)
+
+
+def venue_rows(rng, count):
+    for i in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        yield {
+            'id': i,
+            'name': name(rng, i, rng.choice(['Hall', 'Club', 'Lounge'])),
+            'city': city,
+            'state': state,
+            'address': '%d %s St' % (rng.randint(1, 9999), rng.choice(WORDS)),
+            'phone': '100-%03d-%04d' % divmod(i, 10000),
+            'image_link': 'https://picsum.photos/seed/venue%d/300' % i,
+            'facebook_link': 'https://www.facebook.com/venue%d' % i,
+            'website_link': 'https://venue%d.example.com' % i,
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'seeking_talent': rng.random() < 0.3,
+            'seeking_description': '',
+        }
+
+
+def artist_rows(rng, count):
+    for i in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        yield {
+            'id': i,
+            'name': name(rng, i, rng.choice(['Band', 'Trio', 'Collective'])),
+            'city': city,
+            'state': state,
+            'phone': '200-%03d-%04d' % divmod(i, 10000),
+            'genres': rng.sample(GENRES, rng.randint(1, 2)),
+            'image_link': 'https://picsum.photos/seed/artist%d/300' % i,
+            'facebook_link': 'https://www.facebook.com/artist%d' % i,
+            'website_link': 'https://artist%d.example.com' % i,
+            'seeking_venue': rng.random() < 0.3,
+            'seeking_description': '',
+        }
+
+
+def show_rows(rng, count, venues, artists, today):
+    start = datetime(today.year, today.month, today.day) - timedelta(days=365)
+    for i in range(1, count + 1):
+        yield {
+            'id': i,
+            'venue_id': rng.randint(1, venues),
+            'artist_id': rng.randint(1, artists),
+            'start_time': start + timedelta(
+                days=rng.randrange(730), hours=rng.randrange(12, 24)),
+        }
+
+
+def split_genres(rows, links, owner):
+    # moves each row's genre names into `links` as link table rows
+    for row in rows:
+        for genre in row.pop('genres'):
+            links.append({owner: row['id'],
+                          'genre_id': GENRES.index(genre) + 1})
+        yield row
+
+
+def insert(db, table, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+
+
+def sync_sequences(db):
+    # rows were inserted with explicit ids, so move Postgres' id sequences
+    # past them for rows created later through the app
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in ('genre', 'venue', 'artist', 'show'):
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('%s', 'id'), "
+            "(SELECT max(id) FROM %s))" % (table, table)))
+
+
+def seed(db, shows, seed=0, today=None):
+    # replaces every genre, venue, artist and show (and drops queued jobs,
+    # which the full refresh below supersedes, and the page versions, which
+    # start over from this commit)
+    from models import (
+        Genre, Venue, Artist, Show, Job, PageVersion, venue_genre,
+        artist_genre
+    )
+    from counters import refresh_counters
+    from feed import refresh_feed
+    from cache import pending_tags
+
+    rng = random.Random(seed)
+    venues = max(1, shows // SHOWS_PER_VENUE)
+    artists = max(1, shows // SHOWS_PER_ARTIST)
+
+    for table in (Job.__table__, PageVersion.__table__, venue_genre,
+                  artist_genre, Show.__table__, Artist.__table__,
+                  Venue.__table__, Genre.__table__):
+        db.session.execute(table.delete())
+    insert(db, Genre.__table__, ({'id': i, 'name': genre}
+                                 for i, genre in enumerate(GENRES, 1)))
+    venue_links, artist_links = [], []
+    insert(db, Venue.__table__,
+           split_genres(venue_rows(rng, venues), venue_links, 'venue_id'))
+    insert(db, Artist.__table__,
+           split_genres(artist_rows(rng, artists), artist_links, 'artist_id'))
+    insert(db, venue_genre, venue_links)
+    insert(db, artist_genre, artist_links)
+    insert(db, Show.__table__,
+           show_rows(rng, shows, venues, artists, today or SEED_DAY))
+    sync_sequences(db)
+    refresh_counters('venue')
+    refresh_counters('artist')
+    refresh_feed()
+    pending_tags(db.session).update(('venues', 'artists'))
+    db.session.commit()
+    return venues, artists, shows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Replace the data in DATABASE_URL with generated rows.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k',
+                        help='number of shows')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from app import db
+    print('%d venues, %d artists, %d shows' % seed(
+        db, SCALES[args.scale], args.seed))
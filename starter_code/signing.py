@@ -0,0 +1,24 @@
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import URLSafeTimedSerializer
+#----------------------------------------------------------------------------#
+# Session signing.
+#----------------------------------------------------------------------------#
+
+
+class RotatingSessionInterface(SecureCookieSessionInterface):
+    # Signs session cookies with the current SECRET_KEYS entry and still
+    # accepts cookies signed with any of the previous ones, so keys can be
+    # rotated without logging everyone out or breaking in-flight forms.
+
+    def get_signing_serializer(self, app):
+        keys = app.config.get('SECRET_KEYS') or [app.secret_key]
+        if not all(keys):
+            return None
+        return URLSafeTimedSerializer(
+            keys[::-1],
+            salt=self.salt,
+            serializer=self.serializer,
+            signer_kwargs=dict(
+                key_derivation=self.key_derivation,
+                digest_method=self.digest_method
+            ))
@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+import pytest
+from sqlalchemy import event
+
+# app.py builds its engines from the environment when imported, so point it
+# at a throwaway SQLite file first. Jobs run inline and the page cache is off
+# so every request does its work where the tests can see it.
+DIRECTORY = tempfile.mkdtemp(prefix='fyyur-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(
+    DIRECTORY, 'primary.sqlite')
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+os.environ['CACHE_BACKEND'] = ''
+os.environ['JOBS_INLINE'] = 'true'
+os.environ['LOG_FILE'] = os.path.join(DIRECTORY, 'fyyur.log')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import config  # noqa: E402
+config.WTF_CSRF_ENABLED = False
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app, db
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture(scope='session')
+def db(app):
+    from app import db
+    return db
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def seeded(app, db):
+    # seeded(shows) replaces the data with `shows` generated shows (and
+    # venues and artists in proportion); returns (venues, artists, shows)
+    from seed import seed
+
+    def reseed(shows):
+        with app.app_context():
+            counts = seed(db, shows)
+            db.session.remove()
+        return counts
+    return reseed
+
+
+@pytest.fixture
+def statements(db):
+    # the SQL statements issued while the test runs
+    issued = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        issued.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield issued
+    event.remove(db.engine, 'before_cursor_execute', record)
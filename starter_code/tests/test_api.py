@@ -0,0 +1,123 @@
+import gzip
+import json
+import pytest
+
+VENUE = {
+    'name': 'API Hall',
+    'city': 'Austin',
+    'state': 'TX',
+    'address': '1 Main St',
+    'phone': '500-000000001',
+    'genres': ['Jazz', 'Blues'],
+    'facebook_link': 'https://www.facebook.com/apihall',
+    'seeking_talent': True,
+}
+
+
+def test_fields_select_the_item_fields(client, seeded):
+    seeded(300)
+    body = client.get('/api/v1/venues?fields=id,genres,state').get_json()
+    assert len(body['data']) == 15
+    for item in body['data']:
+        assert set(item) == {'id', 'genres', 'state'}
+        assert item['genres'] and len(item['state']) == 2
+
+    # the defaults, and the whole item on the detail route
+    item = client.get('/api/v1/venues').get_json()['data'][0]
+    assert set(item) == {'id', 'name', 'city', 'state'}
+    detail = client.get('/api/v1/venues/%d' % item['id']).get_json()['data']
+    assert 'seeking_talent' in detail and 'upcoming_shows_count' in detail
+
+    response = client.get('/api/v1/venues?fields=id,password,owner')
+    assert response.status_code == 400
+    assert response.get_json()['fields'] == ['owner', 'password']
+
+
+def test_limit_is_checked_and_clamped(client, seeded):
+    seeded(300)
+    path = '/api/v1/shows?when=all&fields=id&limit='
+    assert client.get(path + 'ten').status_code == 400
+    assert len(client.get(path + '1000').get_json()['data']) == 100
+    assert len(client.get(path + '0').get_json()['data']) == 1
+    assert len(client.get(path + '25').get_json()['data']) == 25
+
+
+@pytest.mark.parametrize('accept', ['br', 'gzip', 'br, gzip', 'identity'])
+def test_responses_are_compressed_as_accepted(client, seeded, accept):
+    seeded(300)
+    if 'br' in accept:
+        brotli = pytest.importorskip('brotli')
+    path = '/api/v1/shows?when=all&limit=50'
+    plain = client.get(path, headers={'Accept-Encoding': 'identity'}).data
+    response = client.get(path, headers={'Accept-Encoding': accept})
+    encoding = response.headers.get('Content-Encoding')
+
+    if 'br' in accept:
+        assert encoding == 'br'
+        assert brotli.decompress(response.data) == plain
+    elif accept == 'gzip':
+        assert encoding == 'gzip'
+        assert gzip.decompress(response.data) == plain
+    else:
+        assert encoding is None and response.data == plain
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(json.loads(plain)['data']) == 50
+
+
+def test_small_responses_are_not_compressed(client, seeded):
+    from api import COMPRESS_MIN_SIZE
+    seeded(20)
+    response = client.get('/api/v1/venues/1?fields=id',
+                          headers={'Accept-Encoding': 'br, gzip'})
+    assert len(response.data) < COMPRESS_MIN_SIZE
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_create_validates_and_returns_the_new_item(client, seeded):
+    seeded(20)
+    response = client.post('/api/v1/venues', json=VENUE)
+    assert response.status_code == 201
+    created = response.get_json()['data']
+    assert created['name'] == 'API Hall'
+    assert sorted(created['genres']) == ['Blues', 'Jazz']
+    assert created['seeking_talent'] is True
+    assert response.headers['Location'].endswith(
+        '/api/v1/venues/%d' % created['id'])
+    assert client.get(response.headers['Location']).get_json()[
+        'data'] == created
+
+    assert client.post('/api/v1/venues', json=[VENUE]).status_code == 400
+    assert client.post('/api/v1/venues', data='{',
+                       content_type='application/json').status_code == 400
+    response = client.post('/api/v1/venues', json=dict(VENUE, name=''))
+    assert response.status_code == 422
+    assert list(response.get_json()['fields']) == ['name']
+
+    response = client.post('/api/v1/shows', json={
+        'venue_id': created['id'], 'artist_id': 99999,
+        'start_time': '2027-06-01 20:00:00'})
+    assert response.status_code == 422
+    assert list(response.get_json()['fields']) == ['artist_id']
+
+
+def test_cursors_page_through_a_filtered_list(client, seeded):
+    seeded(300)
+    path = '/api/v1/venues?state=%s&fields=id,state&limit=2'
+    # the state with the most venues
+    states = [item['state'] for item in client.get(
+        '/api/v1/venues?fields=state').get_json()['data']]
+    state = max(states, key=states.count)
+    everything = client.get(path.replace('limit=2', 'limit=100') % state)
+    expected = [item['id'] for item in everything.get_json()['data']]
+
+    walked, cursor = [], None
+    while True:
+        query = '&after=' + cursor if cursor else ''
+        body = client.get(path % state + query).get_json()
+        assert len(body['data']) <= 2
+        assert all(item['state'] == state for item in body['data'])
+        walked.extend(item['id'] for item in body['data'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert walked == expected and len(expected) > 2
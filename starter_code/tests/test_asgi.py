@@ -0,0 +1,66 @@
+import asyncio
+import re
+
+# the CSRF token differs between any two renders of a form
+TOKEN = re.compile(rb'name="csrf_token"[^>]*>')
+
+
+def page(status, headers, body):
+    # the async views skip the page cache and so its validators (see
+    # asgi.py), the rest must match
+    return status, headers.get('content-type'), TOKEN.sub(b'', body)
+
+
+def async_pages(paths):
+    # each path as served by asgi.application, the async views for the
+    # pages they cover
+    import httpx
+    from asgi import application, database
+
+    async def get_all():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url='http://localhost') as client:
+            try:
+                return [await client.get(path) for path in paths]
+            finally:
+                # the engines belong to this event loop
+                await database.dispose()
+    return [page(response.status_code, response.headers,
+                 response.content)
+            for response in asyncio.run(get_all())]
+
+
+def test_async_views_render_what_the_flask_views_do(client, seeded):
+    from asgi import ASYNC_VIEWS
+    seeded(600)
+    first = client.get('/api/v1/venues?fields=id,state').get_json()['data'][0]
+    artist = client.get('/api/v1/artists').get_json()['data'][0]['id']
+    paths = [
+        '/venues',
+        '/venues?state=%s' % first['state'],
+        '/venues?genre=Jazz',
+        '/shows',
+        '/venues/%d' % first['id'],
+        '/artists/%d' % artist,
+        '/venues/99999',
+        '/artists/99999',
+        '/shows?after=tampered',
+    ]
+    # second pages, through the cursors the first ones link to
+    for path in ('/venues', '/shows'):
+        link = re.search(rb'href="(/\w+\?after=[^"]+)"', client.get(path).data)
+        paths.append(link.group(1).decode())
+
+    expected = [page(response.status_code, response.headers, response.data)
+                for response in map(client.get, paths)]
+    served = async_pages(paths)
+
+    for path, want, got in zip(paths, expected, served):
+        assert got == want, path
+    assert [status for status, content_type, body in served].count(
+        200) == 8
+    # every async view took part
+    assert set(ASYNC_VIEWS) == set(
+        client.application.url_map.bind('localhost').match(
+            path.split('?')[0])[0] for path in paths)
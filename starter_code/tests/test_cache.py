@@ -0,0 +1,39 @@
+import os
+import time
+
+
+def entry_files(directory):
+    return [name for name in os.listdir(directory) if name != 'tags']
+
+
+def test_file_cache_keeps_at_most_cache_size_entries(app, tmp_path):
+    from cache import FileCache
+    cache = FileCache(str(tmp_path), maxsize=20, ttl=60)
+    now = time.time()
+    for i in range(100):
+        cache.set('/venues/%d' % i, 'page %d' % i, {'venues'}, now, now + 60)
+    assert len(entry_files(str(tmp_path))) <= 20
+    # the newest survive
+    assert cache.get('/venues/99') == 'page 99'
+
+
+def test_file_cache_prunes_files_older_than_ttl(app, tmp_path):
+    from cache import FileCache
+    cache = FileCache(str(tmp_path), maxsize=20, ttl=60)
+    now = time.time()
+    cache.set('/venues/1', 'page', {'venue:1'}, now, now + 60)
+    cache.invalidate({'venue:2'})
+
+    assert cache.prune(now + 30) == 0
+    assert cache.prune(now + 120) == 2
+    assert entry_files(str(tmp_path)) == []
+    assert os.listdir(str(tmp_path / 'tags')) == []
+
+
+def test_page_key_drops_arguments_pages_do_not_read(app):
+    from cache import page_key
+    with app.test_request_context(
+            '/venues?utm_source=mail&state=TX&genre=Jazz&_=1'):
+        assert page_key() == '/venues?genre=Jazz&state=TX'
+    with app.test_request_context('/artists?utm_source=mail'):
+        assert page_key() == '/artists'
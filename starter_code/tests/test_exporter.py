@@ -0,0 +1,20 @@
+import csv
+import io
+
+
+def test_csv_export_leaves_empty_genre_lists_blank(app, db, seeded):
+    from exporter import export
+    from models import Venue
+    seeded(20)
+    with app.app_context():
+        venue = db.session.query(Venue).first()
+        venue_id = venue.id
+        venue.genres = []
+        db.session.commit()
+        rows = list(csv.DictReader(io.StringIO(''.join(
+            export('venues', 'csv')))))
+        db.session.remove()
+
+    genres = dict((int(row['id']), row['genres']) for row in rows)
+    assert genres[venue_id] == ''
+    assert all(genres[other] for other in genres if other != venue_id)
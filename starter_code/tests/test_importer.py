@@ -0,0 +1,103 @@
+import json
+from datetime import timedelta
+
+
+def numbered(rows):
+    # (line, values) pairs as the readers yield them
+    return [(line, row) for line, row in enumerate(rows, 1)]
+
+
+def test_show_import_refreshes_only_the_new_shows_feed_rows(
+        app, db, seeded, monkeypatch):
+    from importer import import_rows
+    from jobs import JOB_HANDLERS
+    from models import Show, UpcomingShow
+    from seed import SEED_DAY
+    seeded(200)
+    refreshed = []
+    refresh = JOB_HANDLERS['refresh_feed']
+
+    def record(**args):
+        refreshed.append(json.loads(json.dumps(args)))
+        refresh(**args)
+    monkeypatch.setitem(JOB_HANDLERS, 'refresh_feed', record)
+
+    with app.app_context():
+        show = db.session.query(Show.venue_id, Show.artist_id).first()
+        # after every seeded show
+        start = SEED_DAY + timedelta(days=400)
+        report = import_rows('shows', numbered([{
+            'venue_id': show.venue_id,
+            'artist_id': show.artist_id,
+            'start_time': str(start + timedelta(hours=i)),
+        } for i in range(3)]))
+        assert report.inserted == 3
+        new = sorted(show_id for show_id, in db.session.query(Show.id).filter(
+            Show.start_time >= start))
+        feed = sorted(show_id for show_id, in db.session.query(
+            UpcomingShow.id).filter(UpcomingShow.start_time >= start))
+        db.session.remove()
+
+    assert refreshed == [{'show': new, 'venue': [], 'artist': []}]
+    assert feed == new
+
+
+def test_venue_import_inserts_the_batch_at_once_and_links_genres(
+        app, db, seeded, statements):
+    from importer import import_rows
+    from models import Venue
+    seeded(20)
+    rows = [{
+        'name': 'Imported Hall %d' % i,
+        'city': 'Austin',
+        'state': 'TX',
+        'address': '%d Main St' % i,
+        'phone': '400-%09d' % i if i else '',
+        'facebook_link': 'https://www.facebook.com/imported%d' % i,
+        'website_link': 'https://imported%d.example.com' % i,
+        'genres': ['Jazz', 'Folk'] if i % 2 else ['Blues'],
+    } for i in range(50)]
+
+    with app.app_context():
+        del statements[:]
+        report = import_rows('venues', numbered(rows))
+        assert report.inserted == 50
+        inserts = [statement for statement in statements
+                   if statement.startswith('INSERT INTO venue ')]
+        genres = dict((venue.name, sorted(venue.genres))
+                      for venue in db.session.query(Venue).filter(
+                          Venue.name.like('Imported Hall %')))
+        db.session.remove()
+
+    # one executemany for the 49 with a phone, one insert for the other
+    assert len(inserts) == 2
+    assert genres == dict(('Imported Hall %d' % i, ['Folk', 'Jazz'] if i % 2
+                           else ['Blues']) for i in range(50))
+
+
+def test_show_rows_naming_a_venue_or_artist_with_a_non_string_fail(
+        client, seeded):
+    from seed import SEED_DAY
+    seeded(20)
+    artist = client.get('/api/v1/artists?fields=name').get_json()[
+        'data'][0]['name']
+    venue = client.get('/api/v1/venues?fields=name').get_json()[
+        'data'][0]['name']
+    start = str(SEED_DAY + timedelta(days=400))
+    rows = [
+        {'venue': ['Hall'], 'artist': artist, 'start_time': start},
+        {'venue': venue, 'artist': {'name': artist}, 'start_time': start},
+        {'venue': 7, 'artist': artist, 'start_time': start},
+        {'venue': venue, 'artist': artist, 'start_time': start},
+    ]
+    response = client.post(
+        '/api/v1/shows/import',
+        data=''.join(json.dumps(row) + '\n' for row in rows),
+        content_type='application/x-ndjson')
+
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report['rows'], report['inserted'], report['failed']) == (4, 1, 3)
+    assert sorted((error['line'], list(error['errors'])) for error in
+                  report['errors']) == [(1, ['venue']), (2, ['artist']),
+                                  (3, ['venue'])]
@@ -0,0 +1,54 @@
+from datetime import datetime
+import pytest
+
+
+def plan(db, query):
+    # SQLite's EXPLAIN QUERY PLAN details for a Query or Core select
+    statement = getattr(query, 'statement', query).compile(
+        db.engine, compile_kwargs={'literal_binds': True})
+    return [row[-1] for row in db.session.execute(
+        db.text('EXPLAIN QUERY PLAN %s' % statement))]
+
+
+def uses_index(details, table, index):
+    return any(detail.startswith(('SEARCH %s ' % table, 'SCAN %s ' % table))
+               and 'USING INDEX %s' % index in detail for detail in details)
+
+
+@pytest.fixture
+def planner(app, db, seeded):
+    # no ANALYZE: on a couple of hundred rows the statistics favour scans
+    # that a production-sized table would not
+    seeded(200)
+    with app.app_context():
+        yield lambda query: plan(db, query)
+        db.session.remove()
+
+
+@pytest.mark.parametrize('kind, index', [
+    ('venue', 'ix_show_venue_id_start_time'),
+    ('artist', 'ix_show_artist_id_start_time'),
+])
+@pytest.mark.parametrize('when, descending', [('past', True),
+                                              ('upcoming', False)])
+def test_show_slices_search_owner_start_time_index(
+        planner, kind, index, when, descending):
+    from pagination import keyset_query
+    from queries import show_slice_query, SHOW_KEY
+    query = keyset_query(show_slice_query(kind, 1, when, datetime.now()),
+                         SHOW_KEY, descending=descending)
+    assert uses_index(planner(query), 'show', index)
+
+
+def test_feed_rebuild_searches_start_time_index(planner):
+    from feed import feed_rows
+    assert uses_index(planner(feed_rows(datetime.now())), 'show',
+                      'ix_show_start_time')
+
+
+@pytest.mark.parametrize('state', [None, 'CA'])
+def test_venue_listing_reads_state_city_index(planner, state):
+    from pagination import keyset_query
+    from queries import venue_area_query, VENUE_AREA_KEY
+    query = keyset_query(venue_area_query(state=state), VENUE_AREA_KEY)
+    assert uses_index(planner(query), 'venue', 'ix_venue_state_city')
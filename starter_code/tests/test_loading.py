@@ -0,0 +1,61 @@
+import re
+import pytest
+
+# a FROM or JOIN clause: table names (with aliases), comma separated
+TABLES = re.compile(
+    r'\b(?:FROM|JOIN)\s+(\w+(?:\s+AS\s+\w+)?(?:\s*,\s*\w+(?:\s+AS\s+\w+)?)*)')
+
+
+def tables(statement):
+    # the tables a statement reads, subqueries included
+    return frozenset(item.split()[0] for clause in TABLES.findall(statement)
+                     for item in clause.split(','))
+
+
+def page_tables(client, statements, path):
+    # the tables of each statement issued by GET `path`, after a first
+    # request warms up
+    assert client.get(path).status_code == 200
+    del statements[:]
+    assert client.get(path).status_code == 200
+    return sorted(sorted(tables(statement)) for statement in statements)
+
+
+@pytest.fixture
+def show(app, db, seeded):
+    from models import Show
+    seeded(200)
+    with app.app_context():
+        show = db.session.query(Show.venue_id, Show.artist_id).first()
+        db.session.remove()
+    return show
+
+
+def test_artist_listing_joins_nothing(client, statements, show):
+    assert page_tables(client, statements, '/artists') == [
+        ['artist'], ['page_version']]
+
+
+@pytest.mark.parametrize('kind, other', [('venue', 'artist'),
+                                         ('artist', 'venue')])
+def test_detail_page_joins_only_what_it_lists(
+        client, statements, show, kind, other):
+    # the version row, the owner, its genres, and its past and upcoming
+    # shows with the name and image of the other side
+    path = '/%ss/%d' % (kind, getattr(show, kind + '_id'))
+    assert page_tables(client, statements, path) == sorted([
+        sorted([kind, 'page_version']),
+        [kind],
+        sorted([kind, kind + '_genre', 'genre']),
+        sorted(['show', other]),
+        sorted(['show', other]),
+    ])
+
+
+@pytest.mark.parametrize('kind', ['venue', 'artist'])
+def test_edit_page_loads_no_shows(client, statements, show, kind):
+    path = '/%ss/%d/edit' % (kind, getattr(show, kind + '_id'))
+    assert page_tables(client, statements, path) == sorted([
+        [kind],
+        sorted([kind + '_genre', 'genre']),
+    ])
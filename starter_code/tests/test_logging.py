@@ -0,0 +1,34 @@
+import json
+import os
+import time
+
+
+def logged(path, request_id, timeout=2):
+    # the JSON records of a request, once the listener thread has written
+    # its access line
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if os.path.exists(path):
+            with open(path) as log:
+                records = [json.loads(line) for line in log if line.strip()]
+            records = [record for record in records
+                       if record.get('request_id') == request_id]
+            if any('status' in record for record in records):
+                return records
+        time.sleep(0.05)
+    return []
+
+
+def test_requests_are_logged_with_their_id_in_debug(client, seeded):
+    seeded(20)
+    assert client.application.debug
+    response = client.get('/venues', headers={'X-Request-ID': 'log-test-1'})
+    assert response.headers['X-Request-ID'] == 'log-test-1'
+
+    records = logged(client.application.config['LOG_FILE'], 'log-test-1')
+    access = [record for record in records if 'status' in record]
+    assert len(access) == 1
+    assert access[0]['route'] == 'venues'
+    assert access[0]['method'] == 'GET'
+    assert access[0]['status'] == 200
+    assert access[0]['sql_count'] >= 1
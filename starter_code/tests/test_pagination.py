@@ -0,0 +1,82 @@
+from datetime import datetime
+from base64 import urlsafe_b64encode
+import pytest
+
+
+def raw_cursor(text):
+    # a cursor encoding any JSON text, as a client could forge one
+    return urlsafe_b64encode(text.encode()).decode()
+
+
+def test_cursor_round_trip(app):
+    from pagination import encode_cursor, decode_cursor
+    values = [datetime(2027, 1, 1, 20, 30), 'TX', 42]
+    assert decode_cursor(encode_cursor(values)) == values
+
+
+def walk(client, path, name, cursor=None):
+    # the response bodies of the pages from `cursor` on, following next
+    # cursors for 'after' and prev cursors for 'before'
+    follow = {'after': 'next_cursor', 'before': 'prev_cursor'}[name]
+    bodies = []
+    while True:
+        query = '&%s=%s' % (name, cursor) if cursor else ''
+        bodies.append(client.get(path + '?limit=7' + query).get_json())
+        cursor = bodies[-1][follow]
+        if cursor is None:
+            return bodies
+
+
+def ids(body):
+    return [item['id'] for item in body['data']]
+
+
+def test_after_and_before_walk_the_same_pages(client, seeded):
+    seeded(300)
+    forward = walk(client, '/api/v1/artists', 'after')
+    walked = [item for body in forward for item in ids(body)]
+    assert walked == sorted(walked) and len(set(walked)) == 30
+    assert [len(ids(body)) for body in forward] == [7, 7, 7, 7, 2]
+    assert forward[0]['prev_cursor'] is None
+
+    # back from the last page through prev cursors
+    backward = walk(client, '/api/v1/artists', 'before',
+                    forward[-1]['prev_cursor'])
+    assert [ids(body) for body in backward[::-1]] == [
+        ids(body) for body in forward[:-1]]
+
+
+def test_datetime_keyed_pages_walk(client, seeded):
+    from models import Show
+    seeded(300)
+    # upcoming shows, keyed by (start_time, id)
+    walked = [item for body in walk(client, '/api/v1/shows', 'after')
+              for item in ids(body)]
+    with client.application.app_context():
+        upcoming = Show.query.filter(Show.start_time > datetime.now()).count()
+    assert len(set(walked)) == len(walked) == upcoming > 7
+
+
+@pytest.mark.parametrize('path', [
+    '/artists',
+    '/venues',
+    '/shows',
+    '/venues/1/shows/past',
+    '/artists/1/shows/upcoming',
+    '/api/v1/artists',
+    '/api/v1/shows',
+])
+@pytest.mark.parametrize('cursor', [
+    'not a cursor',
+    raw_cursor('{"id": 1}'),
+    raw_cursor('[1, 2, 3, 4]'),
+    raw_cursor('[[1]]'),
+    raw_cursor('["abc", 1]'),
+    raw_cursor('[{"dt": "yesterday"}, 1]'),
+    raw_cursor('[{"dt": 5}, 1]'),
+    raw_cursor('[true, null, 1]'),
+])
+@pytest.mark.parametrize('name', ['after', 'before'])
+def test_bad_cursors_are_rejected(client, seeded, path, cursor, name):
+    seeded(20)
+    assert client.get('%s?%s=%s' % (path, name, cursor)).status_code == 400
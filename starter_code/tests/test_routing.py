@@ -0,0 +1,92 @@
+import os
+import pytest
+from sqlalchemy import create_engine
+from conftest import DIRECTORY
+
+VENUE = {
+    'city': 'Austin',
+    'state': 'TX',
+    'address': '1 Main St',
+    'image_link': 'https://example.com/venue.png',
+    'seeking_description': '',
+}
+
+
+@pytest.fixture
+def replica(app, db, seeded):
+    # a second SQLite database standing in for a replica, where venue 1 has
+    # a name the primary's does not, routed to for the tests' duration
+    from models import Venue
+    seeded(20)
+    path = os.path.join(DIRECTORY, 'replica.sqlite')
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine('sqlite:///' + path)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Venue.__table__.insert().values(
+            id=1, name='Replica Hall', phone='300-000000001', **VENUE))
+
+    replicas = app.extensions['replicas']
+    replicas[:] = [engine]
+    yield engine
+    replicas[:] = []
+    engine.dispose()
+
+
+def venue_names(engine):
+    from models import Venue
+    with engine.connect() as connection:
+        return set(name for name, in connection.execute(
+            Venue.__table__.select().with_only_columns([Venue.name])))
+
+
+def test_read_only_pages_read_the_replica(client, replica):
+    assert b'Replica Hall' in client.get('/venues/1').data
+    # the edit page is not marked read-only
+    assert b'Replica Hall' not in client.get('/venues/1/edit').data
+
+
+def test_writes_go_to_the_primary(app, db, replica):
+    from flask import g
+    from models import Venue
+    with app.test_request_context('/venues'):
+        # even when a read-only page was routed to the replica
+        g.db_replica = replica
+        db.session.add(Venue(name='Primary Hall', phone='300-000000002',
+                             **VENUE))
+        db.session.commit()
+        db.session.remove()
+
+    assert 'Primary Hall' in venue_names(db.engine)
+    assert 'Primary Hall' not in venue_names(replica)
+
+
+def test_writer_reads_the_primary_until_the_window_closes(client, replica):
+    response = client.post('/venues/1/edit', data=dict(
+        VENUE, name='Fresh Hall', phone='300-000000003', genres=['Jazz']))
+    assert response.status_code == 302
+
+    # the replica has not caught up, the writer still sees the new name
+    assert b'Fresh Hall' in client.get('/venues/1').data
+
+    with client.session_transaction() as session:
+        session['db_primary_until'] = 0
+    assert b'Replica Hall' in client.get('/venues/1').data
+
+    # other users were never held on the primary
+    other = client.application.test_client()
+    assert b'Replica Hall' in other.get('/venues/1').data
+
+
+def test_items_created_through_the_api_read_back_from_the_primary(
+        client, replica):
+    response = client.post('/api/v1/venues', json=dict(
+        VENUE, name='API Hall', phone='300-000000004', genres=['Jazz'],
+        facebook_link='https://www.facebook.com/apihall'))
+    assert response.status_code == 201
+    location = response.headers['Location']
+
+    # the replica never gets the new venue, the creator reads it anyway
+    assert client.get(location).get_json()['data']['name'] == 'API Hall'
+    assert client.application.test_client().get(location).status_code == 404
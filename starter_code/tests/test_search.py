@@ -0,0 +1,46 @@
+import pytest
+
+
+def search_statements(client, statements, path, term):
+    # statements issued by one search for `term`, after a first request
+    # warms up, and the number of hits it reported
+    assert client.post(path, data={'search_term': term}).status_code == 200
+    del statements[:]
+    response = client.post(path, data={'search_term': term})
+    assert response.status_code == 200
+    return len(statements), response
+
+
+@pytest.mark.parametrize('kind', ['venue', 'artist'])
+def test_search_statements_do_not_grow_with_matches(
+        client, seeded, statements, kind):
+    seeded(600)
+    names = [item['name'] for item in client.get(
+        '/api/v1/%ss?fields=name&limit=100' % kind).get_json()['data']]
+    path = '/%ss/search' % kind
+
+    one, response = search_statements(client, statements, path, names[0])
+    assert response.data.count(b'href="/%ss/' % kind.encode()) == 1
+    # every seeded name has a space in it
+    many, response = search_statements(client, statements, path, ' ')
+    assert response.data.count(b'href="/%ss/' % kind.encode()) > 10
+
+    assert one == many
+
+
+@pytest.mark.parametrize('kind', ['venue', 'artist'])
+def test_api_search_statements_do_not_grow_with_matches(
+        client, seeded, statements, kind):
+    seeded(600)
+    name = client.get('/api/v1/%ss?fields=name' % kind).get_json()[
+        'data'][0]['name']
+    counts, hits = [], []
+    for term in (name, ' '):
+        path = '/api/v1/%ss/search?q=%s' % (kind, term)
+        client.get(path)
+        del statements[:]
+        hits.append(client.get(path).get_json()['count'])
+        counts.append(len(statements))
+
+    assert hits[0] == 1 and hits[1] > 10
+    assert counts[0] == counts[1]
@@ -0,0 +1,25 @@
+from seed import SHOWS_PER_VENUE
+
+
+def venues_statements(client, statements):
+    # statements issued by GET /venues, after a first request warms up
+    assert client.get('/venues').status_code == 200
+    del statements[:]
+    response = client.get('/venues')
+    assert response.status_code == 200
+    return len(statements), response.data.count(b'href="/venues/')
+
+
+def test_venue_listing_statements_do_not_grow_with_venues(
+        client, seeded, statements):
+    from pagination import PER_PAGE
+    # N and 10N venues, all on the first page
+    venues = PER_PAGE // 10
+    seeded(venues * SHOWS_PER_VENUE)
+    few, listed = venues_statements(client, statements)
+    assert listed == venues
+    seeded(10 * venues * SHOWS_PER_VENUE)
+    many, listed = venues_statements(client, statements)
+    assert listed == 10 * venues
+
+    assert few == many